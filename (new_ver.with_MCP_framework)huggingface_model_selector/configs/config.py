@@ -3,3 +3,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 HF_TOKEN = os.getenv("HF_TOKEN") or os.getenv("HUGGINGFACE_HUB_TOKEN") or None
+
+# Ollama 回應的持久化快取（SQLite），重啟後相同輸入不必再問一次 LLM
+OLLAMA_CACHE_PATH = os.getenv("OLLAMA_CACHE_PATH") or os.path.join(os.path.expanduser("~"), ".cache", "tablepet_ollama.sqlite")
+# HF 搜尋結果的持久化快取（SQLite），重啟後相同的搜尋在有效期限內不必再打 HF API
+HF_SEARCH_CACHE_PATH = os.getenv("HF_SEARCH_CACHE_PATH") or os.path.join(os.path.expanduser("~"), ".cache", "tablepet_hf_search.sqlite")
@@ -1,4 +1,8 @@
 import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
 
 from configs.config import HF_TOKEN
@@ -8,6 +12,18 @@ from tools.models import load_or_route_model
 
 # 支援「下載：<model_id>」或「執行：<model_id>」的快捷命令
 DOWNLOAD_CMD = re.compile(r"^(下載|執行)\s*[:：]\s*(\S+)$", re.IGNORECASE)
+# 一般自然語句不會以這兩個詞開頭，先用 startswith 過濾掉，省下一次 regex 比對
+DOWNLOAD_PREFIXES = ("下載", "執行")
+
+# NLU 呼叫（分類、英譯）共用的執行緒池；不放在 with 裡，分類失敗時可直接返回不必等英譯
+_NLU_POOL = ThreadPoolExecutor(max_workers=4)
+
+# (任務, 關鍵詞) → (時間, HF 搜尋結果)；改寫過的問句只要抽出相同關鍵詞就不必再打 HF API
+# 沒有結果的不快取（可能只是暫時查不到），有效期限與 hf_search 的記憶體快取相同
+_HF_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_HF_CACHE_MAX = 256
+_HF_CACHE_TTL = 300         # 秒
+_HF_CACHE_LOCK = threading.Lock()
 
 class Router:
     def handle(self, user_text: str) -> Dict[str, Any]:
@@ -19,16 +35,21 @@ class Router:
           - 錯誤: {"type":"error","message":...}
         """
         # 1) 直接下載指令
-        m = DOWNLOAD_CMD.match(user_text.strip())
+        stripped = user_text.strip()
+        m = DOWNLOAD_CMD.match(stripped) if stripped.startswith(DOWNLOAD_PREFIXES) else None
         if m:
             return self._execute_model(m.group(2))
 
         # 2) NLU：任務分類 + 英譯 + 關鍵詞
-        task = classify_prompt(user_text) or "unknown"
+        #    分類與英譯都只依賴原文、彼此獨立 → 同時跑；關鍵詞要等英譯結果
+        f_task = _NLU_POOL.submit(classify_prompt, user_text)
+        f_query = _NLU_POOL.submit(translate_to_english, user_text)
+        task = f_task.result() or "unknown"
         if task == "unknown":
+            f_query.cancel()
             return {"type": "error", "message": f"無法判斷任務類型：{user_text}"}
+        query_en = f_query.result()
 
-        query_en = translate_to_english(user_text)
         keywords = extract_hf_keywords(query_en)
 
         # 4) 依序嘗試同一任務（如 text-generation），若為 0 → 試「備援任務」
@@ -39,11 +60,26 @@ class Router:
         if task != "text-generation":
             fallback_tasks.append("text-generation")
 
-        items = hf_search_try_many(
-            tasks=fallback_tasks,
-            queries=keywords,
-            token=HF_TOKEN
-        )
+        cache_key = (task, tuple(sorted(keywords)))
+        items = None
+        with _HF_CACHE_LOCK:
+            hit = _HF_CACHE.get(cache_key)
+            if hit is not None and time.monotonic() - hit[0] < _HF_CACHE_TTL:
+                _HF_CACHE.move_to_end(cache_key)
+                items = hit[1]
+
+        if items is None:
+            items = hf_search_try_many(
+                tasks=fallback_tasks,
+                queries=keywords,
+                token=HF_TOKEN
+            )
+            if items:
+                with _HF_CACHE_LOCK:
+                    _HF_CACHE[cache_key] = (time.monotonic(), items)
+                    _HF_CACHE.move_to_end(cache_key)
+                    while len(_HF_CACHE) > _HF_CACHE_MAX:
+                        _HF_CACHE.popitem(last=False)
 
         return {
             "type": "search_results",
@@ -51,7 +87,8 @@ class Router:
             "keywords":keywords,
             "query_en": query_en,
             "count": len(items or []),
-            "items": items or [],
+            # 回傳複本，呼叫端修改清單時不會改到快取內容
+            "items": list(items or []),
         }
 
     def _execute_model(self, model_id: str) -> Dict[str, Any]:
@@ -1,27 +1,158 @@
+import hashlib
+import threading
+import time
 import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from huggingface_hub import hf_hub_url
 from huggingface_hub import HfApi, ModelInfo
 from huggingface_hub.utils import HfHubHTTPError
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from configs.config import HF_SEARCH_CACHE_PATH
+from services.cache import PersistentCache
+
+# 查詢模型大小時的最大並行數（皆為網路 IO）
+MAX_WORKERS = 16
+# 所有搜尋共用的 IO 執行緒池（model_info 與 HEAD 備援都丟進來），總並行數固定為 MAX_WORKERS
+_IO_POOL = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="hf-io")
+# 只 sum 欲顯示的檔案類型
+WEIGHT_EXTS = (".bin", ".safetensors", ".onnx", ".msgpack")
+
+# HEAD 請求遇到這些狀態碼才重試
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# 共用連線池：HEAD 備援請求重用 keep-alive 連線，不必每個檔案都重新 TCP + TLS 握手
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    # 只重試限流 / 暫時性的伺服器錯誤（有 Retry-After 就照它等）；401/403/404 重試也不會變，直接放棄
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.2,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset({"HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    ),
+))
+
+# 搜尋結果快取：同一組 (任務, 關鍵字, limit, token) 在 TTL 內直接回傳，不必再打 HF API
+SEARCH_CACHE_TTL = 300      # 秒
+SEARCH_CACHE_SIZE = 256
+_search_cache: "OrderedDict[Tuple, Tuple[float, List[Dict]]]" = OrderedDict()
+_search_cache_lock = threading.Lock()
+# L2：跨重啟的磁碟快取（下載數、按讚數會變，有效期限比 Ollama 快取短）
+DISK_CACHE_TTL = 3600       # 秒
+_disk_cache = PersistentCache(HF_SEARCH_CACHE_PATH, expire=DISK_CACHE_TTL)
+
+# (model_id, token 雜湊) → 權重檔總大小；熱門模型在不同搜尋裡反覆出現，不必每次再查 model_info
+SIZE_CACHE_SIZE = 512
+_size_cache: "OrderedDict[Tuple[str, Optional[str]], int]" = OrderedDict()
+_size_cache_lock = threading.Lock()
+
+def _token_fingerprint(token: Optional[str]) -> Optional[str]:
+    # token 不直接當 key 存在記憶體裡，只留雜湊
+    return hashlib.sha256(token.encode("utf-8")).hexdigest() if token else None
+
+# 每 1024 倍進一個單位：bit_length 直接算出是第幾級，不必逐級比較
+_SIZE_UNITS = ("B", "KB", "MB", "GB", "TB")
 
 def human_readable_size(size_bytes: int) -> str:
-    if size_bytes >= 1024**3:            # 超過 1 GiB
-        return f"{size_bytes / (1024**3):.2f} GB"
-    elif size_bytes >= 1024**2:          # 超過 1 MiB
-        return f"{size_bytes / (1024**2):.2f} MB"
-    elif size_bytes >= 1024:             # 超過 1 KiB
-        return f"{size_bytes / 1024:.2f} KB"
-    elif size_bytes > 0:
-        return f"{size_bytes} B"
-    else:
+    if size_bytes <= 0:
         return "Unknown"
+    tier = min((size_bytes.bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    if tier == 0:
+        return f"{size_bytes} B"
+    return f"{size_bytes / (1 << (tier * 10)):.2f} {_SIZE_UNITS[tier]}"
+
+
+def _is_weight_file(filename: str) -> bool:
+    # str.endswith 可直接吃 tuple，在 C 層逐一比對，不必再包一層 generator
+    return filename.endswith(WEIGHT_EXTS)
+
+
+def _weight_size_bytes(api: HfApi, model_id: str, token: Optional[str]) -> Optional[int]:
+    """
+    以 model_info(files_metadata=True) 取得各檔案大小（不必再逐檔發 HEAD 請求）
+
+    Returns:
+        int or None: 權重檔總大小（bytes）；取不到 metadata 時回傳 None（不快取，下次再試）
+    """
+    cache_key = (model_id, _token_fingerprint(token))
+    with _size_cache_lock:
+        size_bytes = _size_cache.get(cache_key)
+        if size_bytes is not None:
+            _size_cache.move_to_end(cache_key)
+            return size_bytes
+
+    try:
+        info = api.model_info(model_id, files_metadata=True, token=token)
+    except Exception:
+        return None
+
+    # metadata 已整包拿回來，全部加總才能快取（是否超過 max_size_bytes 由呼叫端比較）
+    size_bytes = sum(f.size or 0 for f in (info.siblings or []) if _is_weight_file(f.rfilename))
+    with _size_cache_lock:
+        _size_cache[cache_key] = size_bytes
+        while len(_size_cache) > SIZE_CACHE_SIZE:
+            _size_cache.popitem(last=False)
+    return size_bytes
+
+
+def _head_content_length(url: str, headers: Dict[str, str]) -> int:
+    try:
+        resp = _SESSION.head(url, allow_redirects=True, timeout=8, headers=headers)
+        return int(resp.headers.get("content-length", 0))
+    except Exception:
+        return 0
+
+
+def _collect_sizes(
+    api: HfApi,
+    models: List[ModelInfo],
+    token: Optional[str],
+    max_size_bytes: Optional[int] = None
+) -> List[int]:
+    """
+    並行查詢每個模型的權重檔大小，回傳與 models 同順序的 bytes 清單
+
+    先對每個模型並行呼叫 model_info；拿不到 metadata 的模型（例如私有/受限倉庫）
+    再把它們的檔案攤平成 (model_index, url) 後並行發 HEAD，最後依 model_index 加總。
+    某個模型一旦超過 max_size_bytes，就取消它尚未送出的 HEAD。
+    """
+    sizes = list(_IO_POOL.map(lambda m: _weight_size_bytes(api, m.modelId, token), models))
+
+    jobs = [
+        (i, hf_hub_url(repo_id=m.modelId, filename=f.rfilename))
+        for i, m in enumerate(models) if sizes[i] is None
+        for f in (m.siblings or []) if _is_weight_file(f.rfilename)
+    ]
+    if jobs:
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        pending: Dict[int, List] = {}
+        for i, url in jobs:
+            pending.setdefault(i, []).append(_IO_POOL.submit(_head_content_length, url, headers))
+        for i, futures in pending.items():
+            for fut in futures:
+                if fut.cancelled():
+                    continue
+                sizes[i] = (sizes[i] or 0) + fut.result()
+                if max_size_bytes and sizes[i] > max_size_bytes:
+                    for rest in futures:
+                        rest.cancel()
+
+    return [size or 0 for size in sizes]
 
 
 def search_models(
     task_keywords: str,
     user_prompt: str,
     limit: int = 10,
-    token: Optional[str] = None
+    token: Optional[str] = None,
+    max_size_bytes: Optional[int] = None
 ) -> List[Dict]:
     """
     使用 Hugging Face API 搜尋符合任務的模型，並擷取模型大小資訊
@@ -31,11 +162,28 @@ def search_models(
         user_prompt: 使用者原始輸入的模型要求
         limit (int): 回傳模型數量上限
         token (str or None): 存取私有模型的 token
+        max_size_bytes (int or None): 模型大小上限；超過就停止計算，大小標示為「>上限」
 
     Returns:
         List[Dict]: 模型資訊字典清單（含大小）
     """
 
+    cache_key = (task_keywords, user_prompt, limit, _token_fingerprint(token), max_size_bytes)
+    with _search_cache_lock:
+        hit = _search_cache.get(cache_key)
+        if hit is not None and time.monotonic() - hit[0] < SEARCH_CACHE_TTL:
+            _search_cache.move_to_end(cache_key)
+            return list(hit[1])
+
+    disk_key = hashlib.blake2b(repr(cache_key).encode("utf-8"), digest_size=16).hexdigest()
+    entry = _disk_cache.get("search", disk_key)
+    # 舊版存的是純 list（沒有時間戳）→ 當作未命中，重新查詢後覆寫
+    if isinstance(entry, dict):
+        # 帶著原本寫入的時間放進 L1，L1 的 TTL 仍以第一次查詢的時間起算
+        age = max(0.0, time.time() - entry["ts"])
+        _remember(cache_key, entry["items"], time.monotonic() - age)
+        return list(entry["items"])
+
     api = HfApi()
 
     def _list(t):  # 小幫手
@@ -53,37 +201,27 @@ def search_models(
     try:
         models = list(_list(token))
     except HfHubHTTPError as e:
-        if "401" in str(e):
+        # 只有壞 token 值得換匿名再試；其餘錯誤（404 任務標籤不存在、限流等）直接往上拋
+        if getattr(e.response, "status_code", None) == 401:
             models = list(_list(None))  # 壞 token → 匿名再試公開模型
         else:
             raise
 
     models_info = []
 
-    for m in models:
-        size_bytes = 0
-        # 只 sum 欲顯示的檔案類型
-        exts = (".bin", ".safetensors", ".onnx", ".msgpack")
-        for f in (m.siblings or []):
-            if any(f.rfilename.endswith(ext) for ext in exts):
-                # 建立 raw 檔案 URL
-                url = hf_hub_url(repo_id=m.modelId, filename=f.rfilename)
-                try:
-                    headers = {"Authorization": f"Bearer {token}"} if token else {}
-                    resp = requests.head(url, allow_redirects=True, timeout=8, headers=headers)
-                    size = int(resp.headers.get("content-length", 0))
-                except Exception:
-                    size = 0
-                size_bytes += size
-
-        size_str = human_readable_size(size_bytes)
+    for m, size_bytes in zip(models, _collect_sizes(api, models, token, max_size_bytes)):
+        if max_size_bytes and size_bytes > max_size_bytes:
+            size_str = f">{human_readable_size(max_size_bytes)}"
+        else:
+            size_str = human_readable_size(size_bytes)
 
         models_info.append({
             "id": m.modelId,
             "tags": m.tags,
             "downloads": m.downloads,
             "likes": m.likes,
-            "lastModified": m.lastModified,
+            # 轉成字串，結果才能以 JSON 存進磁碟快取
+            "lastModified": m.lastModified.isoformat() if m.lastModified else None,
             "task": m.pipeline_tag,
             "private": m.private,
             "size_mb": size_str       #  加入模型大小
@@ -91,4 +229,15 @@ def search_models(
 
     # print(f"✅ 找到 {len(models_info)} 筆模型")
 
-    return models_info
\ No newline at end of file
+    _remember(cache_key, models_info)
+    _disk_cache.set("search", disk_key, {"ts": time.time(), "items": models_info})
+
+    return list(models_info)
+
+
+def _remember(cache_key: Tuple, models_info: List[Dict], stored_at: Optional[float] = None) -> None:
+    with _search_cache_lock:
+        _search_cache[cache_key] = (time.monotonic() if stored_at is None else stored_at, models_info)
+        _search_cache.move_to_end(cache_key)
+        while len(_search_cache) > SEARCH_CACHE_SIZE:
+            _search_cache.popitem(last=False)
\ No newline at end of file
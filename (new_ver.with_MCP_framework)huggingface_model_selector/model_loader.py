@@ -1,36 +1,33 @@
-import ollama
-import subprocess
+import importlib
 from configs.config import HF_TOKEN
 
-from transformers import (
-    AutoModelForCausalLM,
-    AutoModelForSequenceClassification,
-    AutoModelForTokenClassification,
-    AutoModelForSeq2SeqLM,
-    AutoTokenizer,
-)
 from huggingface_hub import HfApi
 
-def load_model(model_id):
-    api = HfApi()
-    info = api.model_info(model_id, token=HF_TOKEN)
+# pipeline_tag → transformers 類別名稱；transformers/torch 很重，等真的要載入模型時才 import
+TASK_TO_MODEL_CLASS = {
+    "text-generation": "AutoModelForCausalLM",
+    "text-classification": "AutoModelForSequenceClassification",
+    "token-classification": "AutoModelForTokenClassification",
+    "translation": "AutoModelForSeq2SeqLM",
+    "summarization": "AutoModelForSeq2SeqLM",
+}
 
-    try:
-        tokenizer = AutoTokenizer.from_pretrained(model_id, token=HF_TOKEN)
+def load_model(model_id, info=None):
+    # 呼叫端已查過 model_info 時直接沿用，不再重打一次 HF API
+    if info is None:
+        info = HfApi().model_info(model_id, token=HF_TOKEN)
 
+    try:
         task = info.pipeline_tag or ""
-        if task == "text-generation":
-            model = AutoModelForCausalLM.from_pretrained(model_id, token=HF_TOKEN)
-        elif task == "text-classification":
-            model = AutoModelForSequenceClassification.from_pretrained(model_id, token=HF_TOKEN)
-        elif task == "token-classification":
-            model = AutoModelForTokenClassification.from_pretrained(model_id, token=HF_TOKEN)
-        elif task in ("translation", "summarization"):
-            model = AutoModelForSeq2SeqLM.from_pretrained(model_id, token=HF_TOKEN)
-        else:
+        class_name = TASK_TO_MODEL_CLASS.get(task)
+        if class_name is None:
             print(f"⚠️ 不支援的 pipeline_tag：{task}，請選擇其他模型")
             return None, None
 
+        transformers = importlib.import_module("transformers")
+        tokenizer = transformers.AutoTokenizer.from_pretrained(model_id, token=HF_TOKEN)
+        model = getattr(transformers, class_name).from_pretrained(model_id, token=HF_TOKEN)
+
         return model, tokenizer
 
     except Exception as e:
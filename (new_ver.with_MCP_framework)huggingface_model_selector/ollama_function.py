@@ -1,133 +1,147 @@
+import json
 import ollama
-import subprocess
-
-def classify_prompt(prompt_text, max_retries=10):
-    task_labels = [
-        # Multimodal
-        "Audio-Text-to-Text",
-        "Image-Text-to-Text",
-        "Visual Question Answering",
-        "Document Question Answering",
-        "Video-Text-to-Text",
-        "Visual Document Retrieval",
-        "Any-to-Any",
-        # Computer Vision
-        "Depth Estimation",
-        "Image Classification",
-        "Object Detection",
-        "Image Segmentation",
-        "Text-to-Image",
-        "Image-to-Text",
-        "Image-to-Image",
-        "Image-to-Video",
-        "Unconditional Image Generation",
-        "Video Classification",
-        "Text-to-Video",
-        "Zero-Shot Image Classification",
-        "Mask Generation",
-        "Zero-Shot Object Detection",
-        "Text-to-3D",
-        "Image-to-3D",
-        "Image Feature Extraction",
-        "Keypoint Detection",
-        "Video-to-Video",
-        # Natural Language Processing
-        "Text Classification",
-        "Token Classification",
-        "Table Question Answering",
-        "Question Answering",
-        "Zero-Shot Classification",
-        "Translation",
-        "Summarization",
-        "Feature Extraction",
-        "Text Generation",
-        "Fill-Mask",
-        "Sentence Similarity",
-        "Text Ranking",
-        # Audio
-        "Text-to-Speech",
-        "Text-to-Audio",
-        "Automatic Speech Recognition",
-        "Audio-to-Audio",
-        "Audio Classification",
-        "Voice Activity Detection",
-        # Tabular
-        "Tabular Classification",
-        "Tabular Regression",
-        "Time Series Forecasting",
-        # Reinforcement Learning
-        "Reinforcement Learning",
-        "Robotics",
-        # Other
-        "Graph Machine Learning"
-    ]
-
-    labels_text = "\n".join(f"* {label}" for label in task_labels)
-
-    system_instruction = f"""
-        請判斷使用者描述屬於以下哪一個 Hugging Face 任務類別，
-        請直接回傳以下其中「一個」最適合的標籤，不要加任何說明或標點。
-        {labels_text}
-        """
-    full_prompt = f"{system_instruction.strip()}\n\n輸入如下：{prompt_text.strip()}"
-
-    for attempt in range(max_retries):
-        result = subprocess.run(
-            ["ollama", "run", "phi4-mini:3.8b", full_prompt],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            encoding="utf-8",
-            universal_newlines=True
-        )
-
-        print(f"=== DEBUG [Attempt {attempt+1}] stdout ===")
-        print(repr(result.stdout))
-
-        prediction = result.stdout.strip()
-
-        if prediction in task_labels:
-            prediction = prediction.lower().replace(" ", "-")  # → "text-classification"
-            return prediction
-        else:
-            print(f"⚠️ 無效預測：{prediction}，重試中...")
-
-    return prediction
-
-def translate_to_english(text: str, model: str = "phi4-mini:3.8b", max_retries: int = 5) -> str:
+from typing import Optional
+
+# 常駐的 Ollama HTTP client：模型留在 Ollama 伺服器裡，不必每次 fork 一個 `ollama run`
+_CLIENT = ollama.Client()
+# 呼叫結束後模型在伺服器上保留多久（連續提問時免重新載入）
+KEEP_ALIVE = "10m"
+
+def _chat(model: str, system: str, user: str, options: Optional[dict] = None, schema: Optional[dict] = None) -> str:
+    """以 system / user 兩則訊息呼叫本地模型，回傳去頭尾空白的文字內容；schema 可傳 JSON schema 限制輸出。"""
+    response = _CLIENT.chat(
+        model=model,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        options=options,
+        format=schema,
+        keep_alive=KEEP_ALIVE,
+    )
+    return (response["message"]["content"] or "").strip()
+
+# Hugging Face 任務類別（固定不變，放在模組層級只建一次）
+TASK_LABELS = [
+    # Multimodal
+    "Audio-Text-to-Text",
+    "Image-Text-to-Text",
+    "Visual Question Answering",
+    "Document Question Answering",
+    "Video-Text-to-Text",
+    "Visual Document Retrieval",
+    "Any-to-Any",
+    # Computer Vision
+    "Depth Estimation",
+    "Image Classification",
+    "Object Detection",
+    "Image Segmentation",
+    "Text-to-Image",
+    "Image-to-Text",
+    "Image-to-Image",
+    "Image-to-Video",
+    "Unconditional Image Generation",
+    "Video Classification",
+    "Text-to-Video",
+    "Zero-Shot Image Classification",
+    "Mask Generation",
+    "Zero-Shot Object Detection",
+    "Text-to-3D",
+    "Image-to-3D",
+    "Image Feature Extraction",
+    "Keypoint Detection",
+    "Video-to-Video",
+    # Natural Language Processing
+    "Text Classification",
+    "Token Classification",
+    "Table Question Answering",
+    "Question Answering",
+    "Zero-Shot Classification",
+    "Translation",
+    "Summarization",
+    "Feature Extraction",
+    "Text Generation",
+    "Fill-Mask",
+    "Sentence Similarity",
+    "Text Ranking",
+    # Audio
+    "Text-to-Speech",
+    "Text-to-Audio",
+    "Automatic Speech Recognition",
+    "Audio-to-Audio",
+    "Audio Classification",
+    "Voice Activity Detection",
+    # Tabular
+    "Tabular Classification",
+    "Tabular Regression",
+    "Time Series Forecasting",
+    # Reinforcement Learning
+    "Reinforcement Learning",
+    "Robotics",
+    # Other
+    "Graph Machine Learning"
+]
+
+# O(1) 驗證模型輸出是否為合法標籤
+_TASK_LABELS_SET = frozenset(TASK_LABELS)
+_LABELS_TEXT = "\n".join(f"* {label}" for label in TASK_LABELS)
+
+_CLASSIFY_SYSTEM = f"""
+    請判斷使用者描述屬於以下哪一個 Hugging Face 任務類別，
+    請以 JSON 的 task 欄位回傳以下其中「一個」最適合的標籤，不要加任何說明。
+    {_LABELS_TEXT}
+    """.strip()
+
+# 以 JSON schema 限制解碼，模型只能輸出清單內的其中一個標籤，不必再驗證失敗就重試
+_CLASSIFY_SCHEMA = {
+    "type": "object",
+    "properties": {"task": {"type": "string", "enum": TASK_LABELS}},
+    "required": ["task"],
+}
+
+def classify_prompt(prompt_text):
+    raw = _chat(
+        "phi4-mini:3.8b",
+        _CLASSIFY_SYSTEM,
+        f"輸入如下：{prompt_text.strip()}",
+        options={"temperature": 0},
+        schema=_CLASSIFY_SCHEMA,
+    )
+
+    try:
+        prediction = json.loads(raw)["task"]
+    except (ValueError, KeyError, TypeError):
+        prediction = raw
+
+    if prediction in _TASK_LABELS_SET:
+        return prediction.lower().replace(" ", "-")  # → "text-classification"
+
+    print(f"⚠️ 無效預測：{prediction}")
+    return "unknown"
+
+# 系統指令，明確告訴模型只輸出翻譯內容
+_TRANSLATE_SYSTEM = """
+    請將以下文字翻譯成英文，不要添加任何多餘文字或說明，僅輸出純英文翻譯：
+    """.strip()
+
+_KEYWORDS_SYSTEM = """
+    Extract 3-8 concise English keywords/phrases suitable for Hugging Face model search.
+    Focus on TASK and DOMAIN words (e.g., "news", "headline", "title generation", "summarization").
+    Output ONLY a comma-separated list, no explanations.
+    """.strip()
+
+def translate_to_english(text: str, model: str = "phi4-mini:3.8b") -> str:
     """
-    使用 Ollama CLI 呼叫本地 LLM，將輸入文字翻譯成英文。
+    使用本地 Ollama 伺服器（HTTP API）呼叫 LLM，將輸入文字翻譯成英文。
 
     參數:
         text: 要翻譯的原始文字 (任意語言)
         model: Ollama 上可用的本地模型名稱（預設 phi4-mini:3.8b）
-        max_retries: 最多重試次數，遇到空結果時會重試
 
     回傳:
         翻譯後的英文文字（不含多餘說明）
     """
-    # 系統指令，明確告訴模型只輸出翻譯內容
-    system_instruction = """
-    請將以下文字翻譯成英文，不要添加任何多餘文字或說明，僅輸出純英文翻譯：
-    """
-    full_prompt = system_instruction.strip() + "\n\n" + text.strip()
-
-    translation = ""
-    for attempt in range(1, max_retries + 1):
-        result = subprocess.run(
-            ["ollama", "run", model, full_prompt],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            encoding="utf-8",
-            universal_newlines=True
-        )
-        translation = result.stdout.strip()
-        if translation:
-            return translation
-        else:
-            print(f"⚠️ 嘗試第 {attempt} 次，未產生翻譯結果，重試中…")
-
-    # 最後一次嘗試後仍無結果就直接回傳空字串或上一次輸出
-    return translation
+    return _chat(model, _TRANSLATE_SYSTEM, text.strip(), options={"temperature": 0})
 
 def extract_hf_keywords(text: str, model: str = "phi4-mini:3.8b") -> list[str]:
     """
@@ -135,18 +149,7 @@ def extract_hf_keywords(text: str, model: str = "phi4-mini:3.8b") -> list[str]:
     例如輸入：我想下載一個新聞生成的模型
     回傳可能：["news", "headline", "title generation", "news article", "text generation"]
     """
-    system_instruction = """
-    Extract 3-8 concise English keywords/phrases suitable for Hugging Face model search.
-    Focus on TASK and DOMAIN words (e.g., "news", "headline", "title generation", "summarization").
-    Output ONLY a comma-separated list, no explanations.
-    """
-    full_prompt = system_instruction.strip() + "\n\n" + text.strip()
-    result = subprocess.run(
-        ["ollama", "run", model, full_prompt],
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-        encoding="utf-8", universal_newlines=True
-    )
-    raw = (result.stdout or "").strip()
+    raw = _chat(model, _KEYWORDS_SYSTEM, text.strip(), options={"temperature": 0})
     parts = [p.strip() for p in raw.split(",") if p.strip()]
     # 簡單去重
     seen, kws = set(), []
@@ -156,3 +159,10 @@ def extract_hf_keywords(text: str, model: str = "phi4-mini:3.8b") -> list[str]:
             seen.add(q)
             kws.append(p)
     return kws[:8] or []
+
+def embed_text(text: str, model: str = "nomic-embed-text") -> list[float]:
+    """
+    透過本地 Ollama 的 embedding 端點取得文字向量（供語意快取比對用）。
+    """
+    result = _CLIENT.embed(model=model, input=text.strip(), keep_alive=KEEP_ALIVE)
+    return result["embeddings"][0]
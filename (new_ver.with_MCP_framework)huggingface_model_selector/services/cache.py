@@ -0,0 +1,59 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+class PersistentCache:
+    """
+    以 SQLite 實作的 key-value 快取，程式重啟後仍然有效（值以 JSON 儲存）。
+    開檔或讀寫失敗時一律視為未命中，不影響呼叫端原本的流程。
+
+    Args:
+        path (str): SQLite 檔案路徑
+        expire (int): 每筆資料的有效秒數
+    """
+
+    def __init__(self, path: str, expire: int = 86400):
+        self.expire = expire
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                    "PRIMARY KEY (namespace, key))"
+                )
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ 無法開啟快取檔 {path}：{e}")
+            self._conn = None
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        if self._conn is None:
+            return None
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                    (namespace, key)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        if self._conn is None:
+            return
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value, ensure_ascii=False), time.time() + self.expire)
+                )
+        except sqlite3.Error:
+            pass
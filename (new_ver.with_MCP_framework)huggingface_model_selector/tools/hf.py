@@ -1,19 +1,37 @@
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from typing import List, Dict, Optional
 from hf_search import search_models
 
+# 同時進行的 (task, query) 搜尋數上限
+MAX_WORKERS = 6
+
 def hf_search_models(task: str, query_en: str, token: Optional[str]) -> List[Dict]:
     return search_models(task_keywords=task, user_prompt=query_en, token=token)
 
 def hf_search_try_many(tasks: List[str], queries: List[str], token: Optional[str]) -> List[Dict]:
-    seen_ids = set()
-    results: List[Dict] = []
-    for t in tasks:
-        for q in queries:
-            rows = search_models(task_keywords=t, user_prompt=q, token=token)
-            rows = [r for r in rows if r.get("id") not in seen_ids]
-            for r in rows:
-                seen_ids.add(r.get("id"))
-            if rows:
-                results.extend(rows)
-                return results
-    return results
+    # 所有 (task, query) 組合同時搜尋，但仍依原本的優先順序採用「第一個有結果」的組合
+    combos = [(t, q) for t in tasks for q in queries]
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    futures = {
+        executor.submit(search_models, task_keywords=t, user_prompt=q, token=token): i
+        for i, (t, q) in enumerate(combos)
+    }
+    finished: Dict[int, Future] = {}
+    next_idx = 0
+    # 以 id 為 key 的 dict 一次完成去重，並保留原本的插入順序
+    merged: Dict[str, Dict] = {}
+    try:
+        for fut in as_completed(futures):
+            finished[futures[fut]] = fut
+            # 前面的組合都確定是空的，才輪得到後面的結果
+            while next_idx in finished:
+                rows = finished.pop(next_idx).result()
+                next_idx += 1
+                for r in rows:
+                    merged.setdefault(r["id"], r)
+                if merged:
+                    return list(merged.values())
+    finally:
+        # 已找到結果 → 取消還在排隊的搜尋，不等待進行中的請求
+        executor.shutdown(wait=False, cancel_futures=True)
+    return list(merged.values())
@@ -1,17 +1,24 @@
-from typing import Dict, Any
-from huggingface_hub import HfApi
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
+from huggingface_hub import HfApi, ModelInfo
 from configs.config import HF_TOKEN
 from model_loader import load_model as _load_tf_model
 
-def _has_gguf(model_id: str) -> bool:
-    api = HfApi()
-    info = api.model_info(model_id, token=HF_TOKEN)
-    return any((s.rfilename or "").endswith(".gguf") for s in (info.siblings or []))
+_API = HfApi()
+
+# 同一個 model_id 常被重複檢查（點選→載入→重試），快取 model_info 省下重複的 HF 請求
+@lru_cache(maxsize=256)
+def _has_gguf(model_id: str) -> Tuple[bool, ModelInfo]:
+    info = _API.model_info(model_id, token=HF_TOKEN)
+    has_gguf = any((s.rfilename or "").endswith(".gguf") for s in (info.siblings or []))
+    return has_gguf, info
 
 def load_or_route_model(model_id: str) -> Dict[str, Any]:
     # 若倉庫有 .gguf 檔，提示以 Ollama 執行（先不自動 create）
+    info: Optional[ModelInfo] = None
     try:
-        if _has_gguf(model_id):
+        has_gguf, info = _has_gguf(model_id)
+        if has_gguf:
             return {
                 "ok": True,
                 "engine": "ollama",
@@ -22,7 +29,7 @@ def load_or_route_model(model_id: str) -> Dict[str, Any]:
         pass
 
     try:
-        model, tok = _load_tf_model(model_id)
+        model, tok = _load_tf_model(model_id, info=info)
         if model is None:
             return {"ok": False, "message": f"Transformers 載入失敗：{model_id}"}
         return {
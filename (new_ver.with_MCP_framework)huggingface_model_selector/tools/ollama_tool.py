@@ -1,10 +1,66 @@
+from functools import lru_cache
 from ollama_function import classify_prompt as _classify, translate_to_english as _translate ,extract_hf_keywords as _extract
+from ollama_function import embed_text
+from configs.config import OLLAMA_CACHE_PATH
+from services.cache import PersistentCache
+from tools.semantic_cache import SemanticCache
+
+# 相同輸入直接回傳快取結果，省下一次 Ollama 呼叫
+CACHE_SIZE = 512
+
+# 字面不同但語意相近的輸入 → 以 embedding 相似度命中
+_classify_semantic = SemanticCache(embed_text)
+_translate_semantic = SemanticCache(embed_text)
+
+# L2：跨重啟的磁碟快取，放在記憶體 LRU（L1）之後、實際呼叫 Ollama 之前
+_disk_cache = PersistentCache(OLLAMA_CACHE_PATH)
+
+def _is_label(value) -> bool:
+    # classify_prompt 失敗時回傳 "unknown"，不能當成結果快取
+    return bool(value) and value != "unknown"
+
+class _Uncached(Exception):
+    """失敗的結果：以例外跳出 lru_cache，讓它不被記住，下次同樣的輸入仍會重試"""
+
+    def __init__(self, value):
+        super().__init__(value)
+        self.value = value
+
+def _persisted(namespace: str, text: str, compute, cacheable=bool):
+    hit = _disk_cache.get(namespace, text)
+    if hit is not None:
+        return hit
+    value = compute(text)
+    if cacheable(value):
+        _disk_cache.set(namespace, text, value)
+    return value
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _cached_classify(text: str) -> str:
+    value = _persisted("classify", text,
+                       lambda t: _classify_semantic.get_or_compute(t, _classify, _is_label),
+                       _is_label)
+    if not _is_label(value):
+        raise _Uncached(value)
+    return value
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _cached_translate(text: str) -> str:
+    return _persisted("translate", text, lambda t: _translate_semantic.get_or_compute(t, _translate))
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _cached_extract(text: str) -> tuple:
+    return tuple(_persisted("keywords", text, _extract))
 
 def classify_prompt(text: str) -> str:
-    return _classify(text)
+    try:
+        return _cached_classify(text.strip())
+    except _Uncached as e:
+        return e.value
 
 def translate_to_english(text: str) -> str:
-    return _translate(text)
+    return _cached_translate(text.strip())
 
 def extract_hf_keywords(text: str) -> list[str]:
-    return _extract(text)
\ No newline at end of file
+    # 快取存 tuple，回傳新 list 避免呼叫端改到快取內容
+    return list(_cached_extract(text.strip()))
@@ -0,0 +1,66 @@
+import threading
+import numpy as np
+from typing import Any, Callable, List, Optional, Sequence
+
+class SemanticCache:
+    """
+    以 embedding 相似度比對的快取：改寫過但語意相同的輸入（如「新聞摘要」/「請幫我摘要一下新聞」）
+    也能命中，直接回傳先前的結果而不必再呼叫一次 LLM。
+
+    Args:
+        embed_fn: 文字 → 向量 的函式；失敗時視為未命中，不影響原本流程
+        threshold (float): cosine 相似度門檻，超過才算命中
+        max_rows (int): 最多保留幾筆，滿了以 FIFO 淘汰最舊的
+
+    get_or_compute 的 cacheable 用來排除失敗的結果（如 classify 的 "unknown"），
+    避免之後語意相近的輸入都命中同一個失敗值。
+    """
+
+    def __init__(self, embed_fn: Callable[[str], Sequence[float]], threshold: float = 0.92, max_rows: int = 2048):
+        self._embed = embed_fn
+        self.threshold = threshold
+        self.max_rows = max_rows
+        self._matrix: Optional[np.ndarray] = None   # (max_rows, dim)，每列皆已正規化
+        self._values: List[Any] = [None] * max_rows
+        self._size = 0
+        self._next = 0                              # 下一個要寫入（淘汰）的列
+        self._lock = threading.Lock()
+
+    def _vector(self, text: str) -> Optional[np.ndarray]:
+        try:
+            vec = np.asarray(self._embed(text), dtype=np.float32)
+        except Exception:
+            return None
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+
+    def _lookup(self, vec: np.ndarray) -> Optional[Any]:
+        with self._lock:
+            if not self._size or self._matrix.shape[1] != vec.shape[0]:
+                return None
+            sims = self._matrix[:self._size] @ vec
+            best = int(np.argmax(sims))
+            return self._values[best] if sims[best] >= self.threshold else None
+
+    def _insert(self, vec: np.ndarray, value: Any) -> None:
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vec.shape[0]:
+                self._matrix = np.zeros((self.max_rows, vec.shape[0]), dtype=np.float32)
+                self._size = self._next = 0
+            self._matrix[self._next] = vec
+            self._values[self._next] = value
+            self._next = (self._next + 1) % self.max_rows
+            self._size = min(self._size + 1, self.max_rows)
+
+    def get_or_compute(self, text: str, compute: Callable[[str], Any],
+                       cacheable: Callable[[Any], bool] = bool) -> Any:
+        vec = self._vector(text)
+        if vec is not None:
+            hit = self._lookup(vec)
+            if hit is not None:
+                return hit
+
+        value = compute(text)
+        if vec is not None and cacheable(value):
+            self._insert(vec, value)
+        return value
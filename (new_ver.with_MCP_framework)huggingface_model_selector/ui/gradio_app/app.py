@@ -1,9 +1,5 @@
 import gradio as gr
 import pandas as pd
-from config import HF_TOKEN
-from ollama_function import classify_prompt, translate_to_english
-from hf_search import search_models
-from model_loader import load_model
 
 from core.router import Router
 router = Router()
@@ -12,24 +8,32 @@ router = Router()
 DEFAULT_COLUMNS = ["id", "task", "size_mb", "likes", "downloads", "lastModified"]
 
 def search_ui(user_prompt: str):
+    # generator：先立刻回一個「搜尋中」狀態，分類/翻譯/HF 搜尋跑完再送出結果
+    yield (
+        gr.update(),
+        gr.update(choices=[], value=None),
+        gr.update(value="🔍 正在判斷任務類型並搜尋模型...")
+    )
     out = router.handle(user_prompt)
     if out.get("type") != "search_results":
         msg = out.get("message", "❗ 無法搜尋模型")
-        return (
+        yield (
             gr.update(value=pd.DataFrame(columns=DEFAULT_COLUMNS)),
             gr.update(choices=[], value=None),
             gr.update(value=msg)
         )
+        return
     items = out["items"]
     df = pd.DataFrame(items).reindex(columns=DEFAULT_COLUMNS).fillna("N/A")
     status = f"🔍 任務是：{out['query_en']}；推論任務類型為：{out['task']}，正在搜尋對應模型...\n✅ 找到 {len(df)} 筆模型。請從下拉選單點擊選擇要下載的模型。"
-    return (
+    yield (
         gr.update(value=df),
         gr.update(choices=df["id"].tolist(), value=None),
         gr.update(value=status)
     )
 
-def load_ui(model_id: str):
+# track_tqdm：huggingface_hub 下載權重時的 tqdm 進度直接顯示在狀態欄上，不會看起來像卡住
+def load_ui(model_id: str, progress=gr.Progress(track_tqdm=True)):
     if not model_id:
         return gr.update(value="❗ 請先從下拉選單選擇一個模型。")
     out = router.handle(f"下載：{model_id}")
@@ -1,20 +1,66 @@
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from huggingface_hub import hf_hub_url
 from huggingface_hub import HfApi, ModelInfo
 from huggingface_hub.utils import HfHubHTTPError
 from typing import List, Dict, Optional
 
+# 同時進行的 HEAD 請求數（皆為網路 IO）
+MAX_WORKERS = 16
+# 只 sum 欲顯示的檔案類型
+WEIGHT_EXTS = (".bin", ".safetensors", ".onnx", ".msgpack")
+
+# 共用連線池：HEAD 請求重用 keep-alive 連線，不必每個檔案都重新 TCP + TLS 握手
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
+# 每 1024 倍進一個單位：bit_length 直接算出是第幾級，不必逐級比較
+_SIZE_UNITS = ("B", "KB", "MB", "GB", "TB")
+
 def human_readable_size(size_bytes: int) -> str:
-    if size_bytes >= 1024**3:            # 超過 1 GiB
-        return f"{size_bytes / (1024**3):.2f} GB"
-    elif size_bytes >= 1024**2:          # 超過 1 MiB
-        return f"{size_bytes / (1024**2):.2f} MB"
-    elif size_bytes >= 1024:             # 超過 1 KiB
-        return f"{size_bytes / 1024:.2f} KB"
-    elif size_bytes > 0:
-        return f"{size_bytes} B"
-    else:
+    if size_bytes <= 0:
         return "Unknown"
+    tier = min((size_bytes.bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    if tier == 0:
+        return f"{size_bytes} B"
+    return f"{size_bytes / (1 << (tier * 10)):.2f} {_SIZE_UNITS[tier]}"
+
+
+def _head_content_length(url: str, headers: Dict[str, str]) -> int:
+    try:
+        resp = _SESSION.head(url, allow_redirects=True, timeout=8, headers=headers)
+        return int(resp.headers.get("content-length", 0))
+    except Exception:
+        return 0
+
+
+def _collect_sizes(models: List[ModelInfo], token: Optional[str]) -> List[int]:
+    """
+    回傳與 models 同順序的權重檔總大小（bytes）
+
+    list_models 已附上檔案大小的就直接加總；其餘檔案攤平成 (model_index, url)
+    一次並行發 HEAD，總等待時間約為最慢的一個請求，而不是全部相加。
+    """
+    sizes = [0] * len(models)
+    jobs = []
+    for i, m in enumerate(models):
+        for f in (m.siblings or []):
+            if not f.rfilename.endswith(WEIGHT_EXTS):
+                continue
+            if getattr(f, "size", None):
+                sizes[i] += f.size
+            else:
+                jobs.append((i, hf_hub_url(repo_id=m.modelId, filename=f.rfilename)))
+
+    if jobs:
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            lengths = executor.map(lambda job: _head_content_length(job[1], headers), jobs)
+            for (i, _), length in zip(jobs, lengths):
+                sizes[i] += length
+
+    return sizes
 
 
 def search_models(
@@ -70,22 +116,7 @@ def search_models(
 
     models_info = []
 
-    for m in models:
-        size_bytes = 0
-        # 只 sum 欲顯示的檔案類型
-        exts = (".bin", ".safetensors", ".onnx", ".msgpack")
-        for f in (m.siblings or []):
-            if any(f.rfilename.endswith(ext) for ext in exts):
-                # 建立 raw 檔案 URL
-                url = hf_hub_url(repo_id=m.modelId, filename=f.rfilename)
-                try:
-                    headers = {"Authorization": f"Bearer {token}"} if token else {}
-                    resp = requests.head(url, allow_redirects=True, timeout=8, headers=headers)
-                    size = int(resp.headers.get("content-length", 0))
-                except Exception:
-                    size = 0
-                size_bytes += size
-
+    for m, size_bytes in zip(models, _collect_sizes(models, token)):
         size_str = human_readable_size(size_bytes)
 
         models_info.append({
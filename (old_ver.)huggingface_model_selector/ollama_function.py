@@ -1,5 +1,17 @@
 import ollama
-import subprocess
+
+# 常駐的 Ollama HTTP client：走 keep-alive 連線、模型留在伺服器記憶體裡，不必每次 fork 一個 `ollama run`
+# （多個請求要並行處理時，啟動 Ollama 前設定 OLLAMA_NUM_PARALLEL=4）
+_CLIENT = ollama.Client(host="http://localhost:11434")
+KEEP_ALIVE = "10m"
+
+# 同一次執行中重複輸入相同的描述時直接回傳，不再問一次模型（只記成功的結果，失敗的下次仍會重試）
+_CLASSIFY_CACHE = {}
+_TRANSLATE_CACHE = {}
+
+def _generate(model: str, prompt: str) -> str:
+    response = _CLIENT.generate(model=model, prompt=prompt, stream=False, keep_alive=KEEP_ALIVE)
+    return response["response"]
 
 def classify_prompt(prompt_text, max_retries=10):
     task_labels = [
@@ -69,24 +81,23 @@ def classify_prompt(prompt_text, max_retries=10):
         請直接回傳以下其中一個標籤，不要加任何說明或標點。
         {labels_text}
         """
+    cached = _CLASSIFY_CACHE.get(prompt_text.strip())
+    if cached is not None:
+        return cached
+
     full_prompt = f"{system_instruction.strip()}\n\n輸入如下：{prompt_text.strip()}"
 
     for attempt in range(max_retries):
-        result = subprocess.run(
-            ["ollama", "run", "phi4-mini:3.8b", full_prompt],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            encoding="utf-8",
-            universal_newlines=True
-        )
+        output = _generate("phi4-mini:3.8b", full_prompt)
 
         print(f"=== DEBUG [Attempt {attempt+1}] stdout ===")
-        print(repr(result.stdout))
+        print(repr(output))
 
-        prediction = result.stdout.strip()
+        prediction = output.strip()
 
         if prediction in task_labels:
             prediction = prediction.lower().replace(" ", "-")  # → "text-classification"
+            _CLASSIFY_CACHE[prompt_text.strip()] = prediction
             return prediction
         else:
             print(f"⚠️ 無效預測：{prediction}，重試中...")
@@ -95,7 +106,7 @@ def classify_prompt(prompt_text, max_retries=10):
 
 def translate_to_english(text: str, model: str = "phi4-mini:3.8b", max_retries: int = 5) -> str:
     """
-    使用 Ollama CLI 呼叫本地 LLM，將輸入文字翻譯成英文。
+    透過 Ollama HTTP API 呼叫本地 LLM，將輸入文字翻譯成英文。
 
     參數:
         text: 要翻譯的原始文字 (任意語言)
@@ -109,19 +120,17 @@ def translate_to_english(text: str, model: str = "phi4-mini:3.8b", max_retries:
     system_instruction = """
     請將以下文字翻譯成英文，不要添加任何多餘文字或說明，僅輸出純英文翻譯：
     """
+    cached = _TRANSLATE_CACHE.get((model, text.strip()))
+    if cached is not None:
+        return cached
+
     full_prompt = system_instruction.strip() + "\n\n" + text.strip()
 
     translation = ""
     for attempt in range(1, max_retries + 1):
-        result = subprocess.run(
-            ["ollama", "run", model, full_prompt],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            encoding="utf-8",
-            universal_newlines=True
-        )
-        translation = result.stdout.strip()
+        translation = _generate(model, full_prompt).strip()
         if translation:
+            _TRANSLATE_CACHE[(model, text.strip())] = translation
             return translation
         else:
             print(f"⚠️ 嘗試第 {attempt} 次，未產生翻譯結果，重試中…")
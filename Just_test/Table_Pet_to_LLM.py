@@ -1,59 +1,100 @@
 import sys
 import os
+import itertools
+from functools import cached_property
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from PyQt5.QtWidgets import (QApplication, QLabel, QWidget, QMenu, QAction, 
                              QInputDialog, QMessageBox, QTextEdit, QVBoxLayout,
                              QHBoxLayout, QPushButton, QDialog)
-from PyQt5.QtCore import Qt, QTimer, QPoint, QThread, pyqtSignal
-from PyQt5.QtGui import QPixmap, QCursor
+from PyQt5.QtCore import (Qt, QTimer, QPoint, QThread, QObject, QRunnable, QThreadPool,
+                          QMetaObject, Q_ARG, pyqtSignal, pyqtSlot)
+from PyQt5.QtGui import QPixmap, QCursor, QImage, QImageReader, QPixmapCache, QTextCursor
 
-# 导入改进的记忆系统
-from memory_system import SmartChatbotWithMemory
+API_URL = "https://openrouter.ai/api/v1/chat/completions"
 
-class LLMThread(QThread):
-    """处理LLM API请求的执行绪"""
+# API Key 在执行期间不变：只在载入 / reload_api_key() 时读一次环境变数
+_API_KEY = os.getenv("LLM_API_KEY")
+_AUTH_HEADERS = {"Authorization": f"Bearer {_API_KEY}"} if _API_KEY else {}
+
+
+def reload_api_key():
+    """重新读取 LLM_API_KEY（load_dotenv() 之后呼叫）"""
+    global _API_KEY, _AUTH_HEADERS
+    _API_KEY = os.getenv("LLM_API_KEY")
+    _AUTH_HEADERS = {"Authorization": f"Bearer {_API_KEY}"} if _API_KEY else {}
+    return _API_KEY
+
+# 共用同一个 Session，重用 keep-alive 连线
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(["POST"])
+    )
+))
+_SESSION.headers.update({
+    "HTTP-Referer": "https://example.com",
+    "X-Title": "Smart Desktop Pet",
+    "Content-Type": "application/json"
+})
+
+class LLMWorker(QObject):
+    """常驻在单一执行绪里处理LLM API请求（请求依序排队，不必每次开新执行绪）"""
     response_received = pyqtSignal(str)
+    token_received = pyqtSignal(str)   # 串流：每收到一段文字发一次
     error_occurred = pyqtSignal(str)
-    
-    def __init__(self, user_input, context=None):
-        super().__init__()
-        self.user_input = user_input
-        self.context = context  # 新增：包含记忆的完整上下文
         
-    def run(self):
+    @pyqtSlot(str, str)
+    def handle(self, user_input, context):
+        """context 为包含记忆的完整上下文，空字串代表直接用原始输入"""
         try:
-            API_KEY = os.getenv("LLM_API_KEY")
-            if not API_KEY:
+            if not _API_KEY:
                 self.error_occurred.emit("找不到 LLM_API_KEY，请检查 .env 档案")
                 return
-                
-            url = "https://openrouter.ai/api/v1/chat/completions"
-            
-            headers = {
-                "Authorization": f"Bearer {API_KEY}",
-                "HTTP-Referer": "https://example.com",
-                "X-Title": "Smart Desktop Pet",
-                "Content-Type": "application/json"
-            }
             
             # 使用完整上下文而不是原始用户输入
-            message_content = self.context if self.context else self.user_input
+            message_content = context if context else user_input
             
             data = {
                 "model": "z-ai/glm-4.5-air:free",
                 "messages": [
                     {"role": "user", "content": message_content}
-                ]
+                ],
+                "stream": True
             }
             
-            resp = requests.post(url, headers=headers, json=data, timeout=30)
+            resp = _SESSION.post(API_URL, headers=_AUTH_HEADERS, data=orjson.dumps(data), timeout=30, stream=True)
             
             if resp.status_code == 200:
-                response_text = resp.json()["choices"][0]["message"]["content"]
-                self.response_received.emit(response_text)
+                parts = []
+                for line in resp.iter_lines():
+                    # 空行与 ": OPENROUTER PROCESSING" 注解行直接略过
+                    if not line.startswith(b"data: "):
+                        continue
+                    payload = line[6:]
+                    if payload == b"[DONE]":
+                        break
+                    choices = orjson.loads(payload).get("choices")
+                    if not choices:
+                        continue
+                    token = choices[0].get("delta", {}).get("content")
+                    if token:
+                        parts.append(token)
+                        self.token_received.emit(token)
+                self.response_received.emit("".join(parts))
             else:
-                self.error_occurred.emit(f"API错误: {resp.status_code} - {resp.text}")
+                # 只读前 512 bytes 当作错误讯息，不把整个 body 解码
+                snippet = next(resp.iter_content(512), b"").decode("utf-8", "replace")
+                resp.close()
+                self.error_occurred.emit(f"API错误: {resp.status_code} - {snippet}")
                 
         except Exception as e:
             self.error_occurred.emit(f"发生错误: {str(e)}")
@@ -185,25 +226,60 @@ class ChatDialog(QDialog):
         if hasattr(self.parent(), 'send_to_llm'):
             self.parent().send_to_llm(user_input)
 
+class FrameDecoder(QObject):
+    """把背景执行绪解码好的 QImage 送回 GUI 执行绪"""
+    frame_decoded = pyqtSignal(str, QImage)
+
+
+class FrameDecodeTask(QRunnable):
+    """在背景执行绪逐张解码图片（PNG 解压缩不占用 GUI 执行绪）"""
+    def __init__(self, image_paths, decoder):
+        super().__init__()
+        self.image_paths = image_paths
+        self.decoder = decoder
+        
+    def run(self):
+        for path in self.image_paths:
+            image = QImageReader(path).read()
+            if not image.isNull():
+                self.decoder.frame_decoded.emit(path, image)
+
+
+class SaveMemoryTask(QRunnable):
+    """在背景执行绪把记忆写入磁盘"""
+    def __init__(self, memory_bot):
+        super().__init__()
+        self.memory_bot = memory_bot
+        
+    def run(self):
+        self.memory_bot._save_memory()
+
+
 class DesktopPet(QWidget):
     def __init__(self, image_paths, move_speed=8):
         super().__init__()
         self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint | Qt.Tool)
         self.setAttribute(Qt.WA_TranslucentBackground)
         
-        # 初始化记忆系统
-        print("正在初始化记忆系统...")
-        self.memory_bot = SmartChatbotWithMemory()
-        print("记忆系统初始化完成")
-        
-        # 载入图片
-        self.frames = [QPixmap(img_path) for img_path in image_paths]
-        self.frame_index = 0
+        # 载入图片：只记 key（图片路径），QPixmap 放在 QPixmapCache 里
+        QPixmapCache.setCacheLimit(max(QPixmapCache.cacheLimit(), 32 * 1024))  # KB
+        self.frame_keys = list(image_paths)
+        self._frame_cycle = itertools.cycle(enumerate(self.frame_keys))
+        next(self._frame_cycle)      # 第一张在初始化时就显示了
+        self._last_frame_index = 0   # 目前 label 上显示的是哪一张
+        
+        # 第一张同步载入（要用它决定视窗大小），其余交给背景执行绪解码
+        first_frame = self._load_frame(self.frame_keys[0])
+        self._pending_keys = set(self.frame_keys[1:])
+        self._frame_decoder = FrameDecoder()
+        self._frame_decoder.frame_decoded.connect(self._on_frame_decoded)
+        if self._pending_keys:
+            QThreadPool.globalInstance().start(FrameDecodeTask(self.frame_keys[1:], self._frame_decoder))
         
         # 显示图片的 QLabel
         self.label = QLabel(self)
-        self.label.setPixmap(self.frames[self.frame_index])
-        self.resize(self.frames[0].size())
+        self.label.setPixmap(first_frame)
+        self.resize(first_frame.size())
         
         # 计时器：更新动画和移动
         self.timer = QTimer()
@@ -211,21 +287,85 @@ class DesktopPet(QWidget):
         self.timer.start(100)  # 100ms 更新一次
         
         # 初始位置（靠右下）
-        screen = QApplication.primaryScreen().geometry()
-        self.x = screen.width()
-        self.y = screen.height() - self.height()
+        screen = QApplication.primaryScreen()
+        self._update_screen_cache(screen.geometry())
+        screen.geometryChanged.connect(self._update_screen_cache)
+        self.x = self._screen_w
+        self.y = screen.geometry().height() - self.height()
         self.move(self.x, self.y)
+        self._last_x = self.x
         
         self.move_speed = move_speed
         
         # 对话视窗
         self.chat_dialog = None
-        self.llm_thread = None
+        self._streaming = False
+        
+        # LLM 工作执行绪：启动一次，之后的请求都丢进它的事件伫列
+        self._llm_busy = False
+        self.llm_thread = QThread()
+        self.llm_worker = LLMWorker()
+        self.llm_worker.moveToThread(self.llm_thread)
+        self.llm_worker.token_received.connect(self.handle_llm_token)
+        self.llm_worker.response_received.connect(self.handle_llm_response)
+        self.llm_worker.error_occurred.connect(self.handle_llm_error)
+        self.llm_thread.start()
         
         # 设置右键选单
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.show_context_menu)
         
+        # 每 30 秒在背景保存一次记忆（有变动才写），当掉也不会丢太多，关闭时也不必卡在存档
+        self._save_pool = QThreadPool()
+        self._save_pool.setMaxThreadCount(1)
+        self._saved_version = None
+        self._save_timer = QTimer(self)
+        self._save_timer.setInterval(30_000)
+        self._save_timer.timeout.connect(self._save_async)
+        self._save_timer.start()
+        
+    @cached_property
+    def memory_bot(self):
+        """第一次用到时才载入记忆系统（torch + sentence-transformers 很重，只看动画的话不必付这个启动成本）"""
+        from memory_system import SmartChatbotWithMemory
+        print("正在初始化记忆系统...")
+        memory_bot = SmartChatbotWithMemory()
+        print("记忆系统初始化完成")
+        if memory_bot.backend_name == 'simple':
+            QMessageBox.warning(self, "警告", 
+                              "记忆系统依赖未完整安装！\n"
+                              "请执行：pip install sentence-transformers faiss-cpu\n"
+                              "桌宠将使用简化的记忆功能。")
+        stats = memory_bot.get_stats()
+        self._saved_version = (stats['total'], stats['deleted'])  # 刚载入，和磁盘上一致
+        return memory_bot
+        
+    def _memory_loaded(self):
+        return 'memory_bot' in self.__dict__
+        
+    def _save_async(self):
+        """把存档丢给背景执行绪；记忆数量没变就跳过"""
+        if not self._memory_loaded():
+            return
+        stats = self.memory_bot.get_stats()
+        version = (stats['total'], stats['deleted'])
+        if version == self._saved_version:
+            return
+        self._saved_version = version
+        self._save_pool.start(SaveMemoryTask(self.memory_bot))
+        
+    def _flush_memory(self):
+        """关闭前最后一次保存，最多等 2 秒"""
+        self._save_timer.stop()
+        try:
+            self._save_async()
+            if self._save_pool.waitForDone(2000):
+                print("记忆系统已保存")
+            else:
+                print("保存记忆逾时，略过等待")
+        except Exception as e:
+            print(f"保存记忆系统时出错: {e}")
+        
     def show_context_menu(self, position):
         """显示右键选单"""
         context_menu = QMenu(self)
@@ -308,7 +448,7 @@ class DesktopPet(QWidget):
             
     def send_to_llm(self, user_input):
         """发送讯息给LLM - 改进版"""
-        if self.llm_thread and self.llm_thread.isRunning():
+        if self._llm_busy:
             QMessageBox.information(self, "提示", "桌宠还在思考中，请稍等...")
             return
         
@@ -331,49 +471,67 @@ class DesktopPet(QWidget):
                 print(f"新增记忆 ID: {result['memory_id']}")
             
             # 发送完整上下文给LLM
-            self.llm_thread = LLMThread(user_input, llm_context)
-            self.llm_thread.response_received.connect(self.handle_llm_response)
-            self.llm_thread.error_occurred.connect(self.handle_llm_error)
-            self.llm_thread.start()
+            self._streaming = False
+            self._llm_busy = True
+            QMetaObject.invokeMethod(self.llm_worker, "handle", Qt.QueuedConnection,
+                                     Q_ARG(str, user_input), Q_ARG(str, llm_context or ""))
             
         except Exception as e:
             error_msg = f"处理输入时发生错误：{str(e)}"
             QMessageBox.critical(self, "错误", error_msg)
     
+    def _replace_thinking_line(self, html, end_block=True):
+        """把最后一行 "思考中..." 换成 html；包在同一个 edit block 里，只重新排版一次"""
+        display = self.chat_dialog.chat_display
+        cursor = QTextCursor(display.document())
+        cursor.beginEditBlock()
+        cursor.movePosition(QTextCursor.End)
+        cursor.movePosition(QTextCursor.StartOfBlock, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        cursor.insertHtml(html)
+        if end_block:
+            cursor.insertBlock()  # 空行分隔
+        cursor.endEditBlock()
+        
+        # 滚动到底部
+        display.moveCursor(QTextCursor.End)
+        
     def handle_system_response(self, response):
         """处理系统响应"""
         if self.chat_dialog and self.chat_dialog.isVisible():
-            # 移除 "思考中..." 的最后一行
-            cursor = self.chat_dialog.chat_display.textCursor()
-            cursor.movePosition(cursor.End)
-            cursor.select(cursor.LineUnderCursor)
-            cursor.removeSelectedText()
-            cursor.deletePreviousChar()  # 删除换行符
-            
-            # 添加实际响应
-            self.chat_dialog.chat_display.append(f"<b>桌宠:</b> {response}")
-            self.chat_dialog.chat_display.append("")  # 空行分隔
+            self._replace_thinking_line(f"<b>桌宠:</b> {response}")
         else:
             # 如果没有对话视窗，用讯息框显示
             QMessageBox.information(self, "桌宠回应", response)
             
+    def handle_llm_token(self, token):
+        """处理串流片段：直接接在对话记录最后面"""
+        if not (self.chat_dialog and self.chat_dialog.isVisible()):
+            return
+        display = self.chat_dialog.chat_display
+        
+        if not self._streaming:
+            # 第一个片段：把 "思考中..." 换成桌宠的开头
+            self._replace_thinking_line("<b>桌宠:</b> ", end_block=False)
+            self._streaming = True
+        
+        display.moveCursor(display.textCursor().End)
+        display.insertPlainText(token)
+        display.verticalScrollBar().setValue(display.verticalScrollBar().maximum())
+            
     def handle_llm_response(self, response):
         """处理LLM响应"""
+        self._llm_busy = False
+        
+        # 内容已经逐字显示过，只补上空行分隔
+        if self._streaming and self.chat_dialog and self.chat_dialog.isVisible():
+            self._streaming = False
+            self.chat_dialog.chat_display.append("")
+            return
+        
         # 如果对话视窗开着，更新对话记录
         if self.chat_dialog and self.chat_dialog.isVisible():
-            # 移除 "思考中..." 的最后一行
-            cursor = self.chat_dialog.chat_display.textCursor()
-            cursor.movePosition(cursor.End)
-            cursor.select(cursor.LineUnderCursor)
-            cursor.removeSelectedText()
-            cursor.deletePreviousChar()  # 删除换行符
-            
-            # 添加实际响应
-            self.chat_dialog.chat_display.append(f"<b>桌宠:</b> {response}")
-            self.chat_dialog.chat_display.append("")  # 空行分隔
-            
-            # 滚动到底部
-            self.chat_dialog.chat_display.moveCursor(self.chat_dialog.chat_display.textCursor().End)
+            self._replace_thinking_line(f"<b>桌宠:</b> {response}")
         else:
             # 如果没有对话视窗，用讯息框显示
             msg = QMessageBox(self)
@@ -386,47 +544,79 @@ class DesktopPet(QWidget):
             
     def handle_llm_error(self, error_message):
         """处理LLM错误"""
+        self._llm_busy = False
         error_text = f"抱歉，我现在无法回应：{error_message}"
+        streamed, self._streaming = self._streaming, False
         
-        if self.chat_dialog and self.chat_dialog.isVisible():
-            # 移除 "思考中..."
-            cursor = self.chat_dialog.chat_display.textCursor()
-            cursor.movePosition(cursor.End)
-            cursor.select(cursor.LineUnderCursor)
-            cursor.removeSelectedText()
-            cursor.deletePreviousChar()
-            
-            self.chat_dialog.chat_display.append(f"<b>桌宠:</b> <span style='color: red;'>{error_text}</span>")
+        if self.chat_dialog and self.chat_dialog.isVisible() and streamed:
+            # 串流中途出错：保留已显示的内容，接着显示错误
+            self.chat_dialog.chat_display.append(f"<span style='color: red;'>{error_text}</span>")
             self.chat_dialog.chat_display.append("")
+        elif self.chat_dialog and self.chat_dialog.isVisible():
+            self._replace_thinking_line(f"<b>桌宠:</b> <span style='color: red;'>{error_text}</span>")
         else:
             QMessageBox.critical(self, "错误", f"无法连接到LLM服务：\n{error_message}")
             
     def close_application(self):
         """关闭应用程式"""
-        # 保存记忆系统
-        try:
-            print("正在保存记忆系统...")
-            self.memory_bot._save_memory()
-            print("记忆系统已保存")
-        except Exception as e:
-            print(f"保存记忆系统时出错: {e}")
+        # 保存记忆系统（没载入过就没有东西要存）
+        self._flush_memory()
         
         if self.chat_dialog:
             self.chat_dialog.close()
+        self._stop_llm_worker()
         QApplication.quit()
         
+    def _stop_llm_worker(self):
+        """结束LLM工作执行绪（进行中的请求最多等 3 秒）"""
+        if self.llm_thread.isRunning():
+            self.llm_thread.quit()
+            self.llm_thread.wait(3000)
+        
+    def _load_frame(self, key):
+        """同步解码一张图片并放进 QPixmapCache"""
+        pixmap = QPixmap(key)
+        QPixmapCache.insert(key, pixmap)
+        return pixmap
+        
+    def _on_frame_decoded(self, key, image):
+        """背景解码完成：QPixmap 只能在 GUI 执行绪建立"""
+        QPixmapCache.insert(key, QPixmap.fromImage(image))
+        self._pending_keys.discard(key)
+        
+    def _frame_pixmap(self, key):
+        """从 QPixmapCache 取图；还在解码中回传 None，被淘汰了就重新载入"""
+        pixmap = QPixmapCache.find(key)
+        if pixmap is not None and not pixmap.isNull():
+            return pixmap
+        if key in self._pending_keys:
+            return None
+        return self._load_frame(key)
+        
+    def _update_screen_cache(self, geometry):
+        """快取萤幕宽度与绕回的总距离（萤幕大小改变时更新）"""
+        self._screen_w = geometry.width()
+        self._wrap_span = self._screen_w + self.width()
+        
     def update_pet(self):
         """更新桌宠动画和位置"""
-        # 换下一张图
-        self.frame_index = (self.frame_index + 1) % len(self.frames)
-        self.label.setPixmap(self.frames[self.frame_index])
-        
-        # 向左移动
-        self.x -= self.move_speed
-        if self.x < -self.width():  # 出画面就从右边出现
-            screen = QApplication.primaryScreen().geometry()
-            self.x = screen.width()
-        self.move(self.x, self.y)
+        # 看不到就不必换图、移动（省下重绘）
+        if not self.isVisible() or self.isMinimized():
+            return
+        
+        # 换下一张图（还没解码好就先维持目前的画面）
+        frame_index, key = next(self._frame_cycle)
+        if frame_index != self._last_frame_index:
+            pixmap = self._frame_pixmap(key)
+            if pixmap is not None:
+                self.label.setPixmap(pixmap)
+                self._last_frame_index = frame_index
+        
+        # 向左移动，出画面就从右边出现（以取余数绕回，不必每次查询萤幕大小）
+        self.x = ((self.x - self.move_speed + self.width()) % self._wrap_span) - self.width()
+        if self.x != self._last_x:
+            self.move(self.x, self.y)
+            self._last_x = self.x
         
     def mousePressEvent(self, event):
         """处理滑鼠点击事件"""
@@ -455,13 +645,8 @@ class DesktopPet(QWidget):
     
     def closeEvent(self, event):
         """重写关闭事件以保存记忆"""
-        try:
-            print("应用程式关闭中，正在保存记忆...")
-            self.memory_bot._save_memory()
-            print("记忆系统已保存")
-        except Exception as e:
-            print(f"保存记忆时出错: {e}")
-        
+        self._flush_memory()
+        self._stop_llm_worker()
         event.accept()
 
 
@@ -470,11 +655,13 @@ if __name__ == '__main__':
     
     # 载入图片清单
     folder = "Walk"
-    if not os.path.exists(folder):
+    try:
+        # scandir 一次取得档名与档案类型，不必另外 stat 资料夹是否存在
+        with os.scandir(folder) as entries:
+            image_paths = sorted(e.path for e in entries if e.is_file() and e.name.endswith(".png"))
+    except FileNotFoundError:
         QMessageBox.critical(None, "错误", f"找不到图片资料夹 '{folder}'！\n请确保资料夹存在并包含PNG图片档案。")
         sys.exit(1)
-        
-    image_paths = [os.path.join(folder, img) for img in sorted(os.listdir(folder)) if img.endswith(".png")]
     
     if not image_paths:
         QMessageBox.critical(None, "错误", f"在 '{folder}' 资料夹中找不到PNG图片！\n请放入一些桌宠图片。")
@@ -482,23 +669,13 @@ if __name__ == '__main__':
     
     # 检查环境变数
     load_dotenv()
-    if not os.getenv("LLM_API_KEY"):
+    if not reload_api_key():
         QMessageBox.warning(None, "警告", 
                           "找不到 LLM_API_KEY 环境变数！\n"
                           "请在 .env 档案中设置你的API Key。\n"
                           "桌宠仍可正常显示，但无法与LLM对话。\n"
                           "记忆系统功能仍可正常使用。")
     
-    # 检查记忆系统依赖
-    try:
-        from sentence_transformers import SentenceTransformer
-        print("✅ 记忆系统依赖检查完成")
-    except ImportError:
-        QMessageBox.warning(None, "警告", 
-                          "记忆系统依赖未完整安装！\n"
-                          "请执行：pip install sentence-transformers faiss-cpu\n"
-                          "桌宠将使用简化的记忆功能。")
-    
     # 创建并显示桌宠
     pet = DesktopPet(image_paths)
     pet.show()
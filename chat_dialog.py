@@ -7,7 +7,7 @@ from typing import Optional, Callable
 from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTextEdit, 
                              QPushButton, QMessageBox, QInputDialog)
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QFont
+from PyQt5.QtGui import QFont, QTextCursor
 
 
 class ChatDialog(QDialog):
@@ -23,6 +23,9 @@ class ChatDialog(QDialog):
         self.on_show_memories: Optional[Callable[[], None]] = None
         self.on_show_stats: Optional[Callable[[], None]] = None
         
+        # 串流回應進行中（桌寵訊息已開始逐字顯示）
+        self._streaming = False
+        
         self.setup_ui()
         
     def setup_ui(self):
@@ -294,6 +297,11 @@ class ChatDialog(QDialog):
     
     def update_last_pet_message(self, message: str):
         """更新最後一條桌寵訊息（替換"思考中..."）"""
+        if self._streaming:
+            # 串流時內容已逐字顯示完畢，只需結束串流狀態
+            self._streaming = False
+            return
+        
         # 取得當前內容
         current_html = self.chat_display.toHtml()
         
@@ -332,8 +340,20 @@ class ChatDialog(QDialog):
         # 添加桌寵回應
         self.add_pet_message(message)
     
+    def append_to_last_pet_message(self, token: str):
+        """串流模式：把新收到的片段直接接在最後一條桌寵訊息後面"""
+        if not self._streaming:
+            # 第一個片段：先把"思考中..."換成空的桌寵訊息
+            self.update_last_pet_message("")
+            self._streaming = True
+        
+        self.chat_display.moveCursor(QTextCursor.End)
+        self.chat_display.insertPlainText(token)
+        self.chat_display.verticalScrollBar().setValue(self.chat_display.verticalScrollBar().maximum())
+    
     def show_error(self, error_message: str):
         """顯示錯誤訊息"""
+        self._streaming = False
         self.add_system_message(f"❌ 錯誤: {error_message}")
 
 
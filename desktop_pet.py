@@ -816,21 +816,17 @@ def load_animation_frames(folder_path: str) -> List[str]:
     """載入動畫幀圖片路徑"""
     print(f"🔍 載入動畫資料夾: {folder_path}")
     
-    if not os.path.exists(folder_path):
+    try:
+        # scandir 一次取得檔名與檔案類型，不必先 stat 資料夾再 listdir
+        with os.scandir(folder_path) as entries:
+            full_paths = sorted(
+                e.path for e in entries
+                if e.is_file() and e.name.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))
+            )
+    except FileNotFoundError:
         print(f"❌ 資料夾不存在: {folder_path}")
         return []
     
-    
-    all_files = os.listdir(folder_path)
-    #print(f"📁 資料夾中所有檔案: {all_files}")
-    
-    image_files = [f for f in all_files if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))]
-    #print(f"🖼️ 過濾後的圖片檔案: {image_files}")
-    
-    image_files.sort()  # 按檔名排序
-    #print(f"📋 排序後的圖片檔案: {image_files}")
-    
-    full_paths = [os.path.join(folder_path, img) for img in image_files]
     print(f"📍 完整路徑: {full_paths}")
     
     return full_paths
@@ -3,110 +3,122 @@ LLM API 模塊
 處理與語言模型的API通訊
 """
 
+import asyncio
 import os
-import requests
+from concurrent.futures import Future
 from typing import Optional
-from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
 
+from llm_async import AsyncLoopThread, LLMAPIError, complete
+from response_cache import GenerativeCache
 
-class LLMThread(QThread):
-    """處理LLM API請求的執行緒"""
-    response_received = pyqtSignal(str)
-    error_occurred = pyqtSignal(str)
-    
-    def __init__(self, user_input: str, context: Optional[str] = None):
+
+class _CallbackBridge(QObject):
+    """把事件迴圈執行緒的結果轉回 GUI 執行緒，再呼叫對應的回調函數"""
+    invoke = pyqtSignal(object, object)
+
+    def __init__(self):
         super().__init__()
-        self.user_input = user_input
-        self.context = context  # 包含記憶的完整上下文
-        
-    def run(self):
-        try:
-            API_KEY = os.getenv("LLM_API_KEY")
-            if not API_KEY:
-                self.error_occurred.emit("找不到 LLM_API_KEY，請檢查 .env 檔案")
-                return
-                
-            url = "https://openrouter.ai/api/v1/chat/completions"
-            
-            headers = {
-                "Authorization": f"Bearer {API_KEY}",
-                "HTTP-Referer": "https://example.com",
-                "X-Title": "Smart Desktop Pet",
-                "Content-Type": "application/json"
-            }
-            
-            # 使用完整上下文而不是原始用戶輸入
-            message_content = self.context if self.context else self.user_input
-            
-            data = {
-                "model": "z-ai/glm-4.5-air:free",
-                "messages": [
-                    {"role": "user", "content": message_content}
-                ]
-            }
-            
-            resp = requests.post(url, headers=headers, json=data, timeout=30)
-            
-            if resp.status_code == 200:
-                response_text = resp.json()["choices"][0]["message"]["content"]
-                self.response_received.emit(response_text)
-            else:
-                self.error_occurred.emit(f"API錯誤: {resp.status_code} - {resp.text}")
-                
-        except Exception as e:
-            self.error_occurred.emit(f"發生錯誤: {str(e)}")
+        self.invoke.connect(self._dispatch)
+
+    @pyqtSlot(object, object)
+    def _dispatch(self, callback, arg):
+        callback(arg)
+
+
+async def _complete_cached(session, cache: GenerativeCache, user_input: str,
+                           context: Optional[str], on_token) -> str:
+    """
+    先查回應快取，未命中才呼叫LLM，並把回覆存回快取
+
+    在事件迴圈執行緒中執行；編碼交給執行緒池，不卡 GUI，也不擋住其他進行中的請求
+    """
+    scope = GenerativeCache.scope_of(user_input, context)
+    embedding = None
+    try:
+        loop = asyncio.get_running_loop()
+        cached, embedding = await loop.run_in_executor(None, cache.lookup, user_input, scope)
+        if cached is not None:
+            return cached
+    except Exception as e:
+        print(f"查詢回應快取失敗: {e}")
+
+    response = await complete(session, context if context else user_input, on_token)
+    cache.add(embedding, response, scope)
+    return response
 
 
 class LLMAPIManager:
     """LLM API管理器"""
     
-    def __init__(self):
-        self.current_thread = None
+    def __init__(self, cache: Optional[GenerativeCache] = None):
+        self.cache = cache
+        self._bridge = _CallbackBridge()
+        self._loop_thread = AsyncLoopThread()
+        self._loop_thread.start()
+        self._pending = set()
     
     def send_request(self, user_input: str, context: str = None, 
-                    on_success=None, on_error=None) -> bool:
+                    on_success=None, on_error=None, on_token=None) -> bool:
         """
-        發送請求到LLM
+        發送請求到LLM（可同時有多個請求進行中）
         
         Args:
             user_input: 用戶原始輸入
             context: 包含記憶的完整上下文
             on_success: 成功回調函數
             on_error: 錯誤回調函數
+            on_token: 串流回調函數（每收到一段文字呼叫一次），不給則等完整回覆
             
         Returns:
             bool: 是否成功啟動請求
         """
-        if self.current_thread and self.current_thread.isRunning():
-            if on_error:
-                on_error("API正在處理中，請稍候...")
-            return False
-        
         try:
-            self.current_thread = LLMThread(user_input, context)
-            
-            if on_success:
-                self.current_thread.response_received.connect(on_success)
-            if on_error:
-                self.current_thread.error_occurred.connect(on_error)
-                
-            self.current_thread.start()
-            return True
-            
+            token_callback = None
+            if on_token:
+                token_callback = lambda token: self._bridge.invoke.emit(on_token, token)
+            if self.cache:
+                # 語意相近的問題在同樣的記憶下已經回答過 → 直接回傳，不發網路請求
+                future = self._loop_thread.submit(_complete_cached, self.cache, user_input, context, token_callback)
+            else:
+                # 使用完整上下文而不是原始用戶輸入
+                future = self._loop_thread.submit(complete, context if context else user_input, token_callback)
         except Exception as e:
             if on_error:
                 on_error(f"啟動API請求失敗: {str(e)}")
             return False
+        
+        self._pending.add(future)
+        future.add_done_callback(lambda f: self._on_done(f, on_success, on_error))
+        return True
+    
+    def _on_done(self, future: Future, on_success, on_error):
+        """在事件迴圈執行緒中被呼叫，結果經由 bridge 回到 GUI 執行緒"""
+        self._pending.discard(future)
+        if future.cancelled():
+            return
+        
+        error = future.exception()
+        if error is None:
+            if on_success:
+                self._bridge.invoke.emit(on_success, future.result())
+        elif on_error:
+            message = str(error) if isinstance(error, LLMAPIError) else f"發生錯誤: {str(error)}"
+            self._bridge.invoke.emit(on_error, message)
     
     def is_busy(self) -> bool:
-        """檢查API是否忙碌中"""
-        return self.current_thread and self.current_thread.isRunning()
+        """檢查是否還有請求進行中"""
+        return bool(self._pending)
     
     def stop_current_request(self):
-        """停止當前請求（如果可能）"""
-        if self.current_thread and self.current_thread.isRunning():
-            self.current_thread.terminate()
-            self.current_thread.wait()
+        """取消所有進行中的請求"""
+        for future in list(self._pending):
+            future.cancel()
+    
+    def shutdown(self):
+        """關閉事件迴圈與連線池（程式結束時呼叫）"""
+        self.stop_current_request()
+        self._loop_thread.stop()
 
 
 def check_api_key() -> bool:
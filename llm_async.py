@@ -0,0 +1,174 @@
+"""
+非同步 LLM 請求模塊
+以單一 asyncio 事件迴圈 + 共用的 httpx.AsyncClient 處理所有LLM請求
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+import httpx
+import orjson
+from PyQt5.QtCore import QThread
+
+
+API_URL = "https://openrouter.ai/api/v1/chat/completions"
+MODEL = "z-ai/glm-4.5-air:free"
+
+# 遇到限流 / 伺服器錯誤時的重試設定
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRIES = 2
+BACKOFF_FACTOR = 0.3
+
+# 錯誤訊息最多顯示回應內容的前幾個 bytes
+ERROR_SNIPPET_BYTES = 512
+
+STATIC_HEADERS = {
+    "HTTP-Referer": "https://example.com",
+    "X-Title": "Smart Desktop Pet",
+    "Content-Type": "application/json"
+}
+
+
+# API Key 在整個程式執行期間不變：只在載入 / reload_api_key() 時讀一次環境變數
+_API_KEY = os.getenv("LLM_API_KEY")
+_AUTH_HEADERS = {"Authorization": f"Bearer {_API_KEY}"} if _API_KEY else {}
+
+
+def reload_api_key() -> Optional[str]:
+    """重新讀取 LLM_API_KEY（load_dotenv() 之後或測試切換 .env 時呼叫）"""
+    global _API_KEY, _AUTH_HEADERS
+    _API_KEY = os.getenv("LLM_API_KEY")
+    _AUTH_HEADERS = {"Authorization": f"Bearer {_API_KEY}"} if _API_KEY else {}
+    return _API_KEY
+
+
+class LLMAPIError(Exception):
+    """API 回傳非 200 或缺少設定時拋出，訊息可直接顯示給使用者"""
+
+
+def create_client() -> httpx.AsyncClient:
+    """建立共用的 AsyncClient（HTTP/2 + keep-alive 連線池）"""
+    return httpx.AsyncClient(
+        http2=True,
+        headers=STATIC_HEADERS,
+        timeout=30,
+        limits=httpx.Limits(max_keepalive_connections=8)
+    )
+
+
+async def complete(session: httpx.AsyncClient, prompt: str,
+                   on_token: Optional[Callable[[str], None]] = None) -> str:
+    """
+    發送一次對話請求並回傳模型回覆
+
+    Args:
+        session: 共用的 AsyncClient
+        prompt: 包含記憶的完整上下文（或原始輸入）
+        on_token: 有給的話改用串流（SSE），每收到一段文字就呼叫一次
+
+    Returns:
+        str: 模型回覆文字（串流時為所有片段串起來的完整內容）
+    """
+    if not _API_KEY:
+        raise LLMAPIError("找不到 LLM_API_KEY，請檢查 .env 檔案")
+
+    data = {
+        "model": MODEL,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    }
+    if on_token:
+        data["stream"] = True
+
+    # orjson 直接輸出 bytes，重試時也不必重新序列化
+    body = orjson.dumps(data)
+
+    for attempt in range(MAX_RETRIES + 1):
+        async with session.stream("POST", API_URL, headers=_AUTH_HEADERS, content=body) as resp:
+            if resp.status_code == 200:
+                if on_token:
+                    return await _read_stream(resp, on_token)
+                # 只取出需要的欄位，usage 等其餘內容隨 dict 一起丟掉
+                return orjson.loads(await resp.aread())["choices"][0]["message"]["content"]
+            if resp.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+                raise LLMAPIError(f"API錯誤: {resp.status_code} - {await _error_snippet(resp)}")
+        await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+
+
+async def _error_snippet(resp: httpx.Response) -> str:
+    """錯誤訊息只讀回應的前 ERROR_SNIPPET_BYTES 個 bytes，不把整個 body 讀進來解碼"""
+    head = b""
+    async for chunk in resp.aiter_bytes():
+        head += chunk
+        if len(head) >= ERROR_SNIPPET_BYTES:
+            break
+    return head[:ERROR_SNIPPET_BYTES].decode("utf-8", "replace")
+
+
+async def _read_stream(resp: httpx.Response, on_token: Callable[[str], None]) -> str:
+    """逐行解析 SSE，回呼每段 delta.content，最後回傳完整內容"""
+    parts = []
+    async for line in resp.aiter_lines():
+        # 空行與 ": OPENROUTER PROCESSING" 這類註解行直接略過
+        if not line.startswith("data: "):
+            continue
+        payload = line[6:]
+        if payload == "[DONE]":
+            break
+        choices = orjson.loads(payload).get("choices")
+        if not choices:
+            continue
+        token = choices[0].get("delta", {}).get("content")
+        if token:
+            parts.append(token)
+            on_token(token)
+    return "".join(parts)
+
+
+class AsyncLoopThread(QThread):
+    """在背景執行緒跑唯一的 asyncio 事件迴圈，所有請求都以 coroutine 丟進來並行處理"""
+
+    def __init__(self):
+        super().__init__()
+        self.loop = asyncio.new_event_loop()
+        self.client = None
+        self._ready = threading.Event()
+        self._startup_error: Optional[BaseException] = None
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.client = create_client()
+        except Exception as e:
+            # 例如缺少 h2 套件：記下錯誤讓 submit() 拋出，而不是讓 GUI 永遠等下去
+            print(f"❌ 無法建立 HTTP 連線：{e}")
+            self._startup_error = e
+            self.loop.close()
+            return
+        finally:
+            self._ready.set()
+        self.loop.run_forever()
+
+        # 迴圈停止後：取消未完成的請求並關閉連線池
+        pending = asyncio.all_tasks(self.loop)
+        for task in pending:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.loop.run_until_complete(self.client.aclose())
+        self.loop.close()
+
+    def submit(self, coro_fn, *args) -> Future:
+        """把 coro_fn(client, *args) 排進事件迴圈，回傳 thread-safe 的 Future"""
+        self._ready.wait()
+        if self._startup_error is not None:
+            raise self._startup_error
+        return asyncio.run_coroutine_threadsafe(coro_fn(self.client, *args), self.loop)
+
+    def stop(self):
+        """停止事件迴圈並等待執行緒結束"""
+        if self.isRunning():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.wait()
@@ -6,25 +6,56 @@
 import sys
 import os
 from dotenv import load_dotenv
+from PyQt5.QtCore import QRunnable, QThreadPool
 from PyQt5.QtWidgets import QApplication, QMessageBox
 
 # 導入自定義模塊
 from memory_system import SmartChatbotWithMemory
 from llm_api import LLMAPIManager, check_api_key
+from llm_async import reload_api_key
+from response_cache import GenerativeCache
 from desktop_pet import DesktopPet, validate_image_folders
 from chat_dialog import ChatDialog, QuickChatDialog
 
 
+class _MemoryWriteTask(QRunnable):
+    """在背景判斷並寫入記憶，不擋住LLM請求與介面"""
+    
+    def __init__(self, memory_bot: SmartChatbotWithMemory, user_input: str, response_cache: GenerativeCache = None,
+                 memory_decision: dict = None):
+        super().__init__()
+        self.memory_bot = memory_bot
+        self.user_input = user_input
+        self.response_cache = response_cache
+        self.memory_decision = memory_decision
+    
+    def run(self):
+        try:
+            outcome = self.memory_bot.remember_if_needed(self.user_input, self.memory_decision)
+            if outcome['memory_action'] == 'add':
+                print(f"💾 新增記憶 ID: {outcome['memory_id']}")
+                # 記憶變了，之前的回答可能已過時
+                if self.response_cache:
+                    self.response_cache.clear()
+        except Exception as e:
+            print(f"寫入記憶失敗: {e}")
+
+
 class SmartDesktopPetApp:
     """智能桌面寵物應用程式主類"""
     
     def __init__(self):
         # 初始化各個組件
         self.memory_bot = None
+        self.response_cache = None
         self.llm_manager = None
         self.pet_widget = None
         self.chat_dialog = None
         
+        # 記憶寫入依序在單一背景執行緒進行
+        self.memory_pool = QThreadPool()
+        self.memory_pool.setMaxThreadCount(1)
+        
         # 初始化各個模塊
         self._init_memory_system()
         self._init_llm_manager()
@@ -38,6 +69,16 @@ class SmartDesktopPetApp:
             print("正在初始化記憶系統...")
             self.memory_bot = SmartChatbotWithMemory()
             print("✅ 記憶系統初始化成功")
+            
+            # 記憶系統決定好檢索方式後才提示，不另外為了檢查而 import
+            if self.memory_bot.backend_name == 'simple':
+                QMessageBox.warning(None, "警告", 
+                                  "記憶系統依賴未完整安裝！\n"
+                                  "請執行：pip install sentence-transformers faiss-cpu\n"
+                                  "桌寵將使用簡化的記憶功能。")
+            
+            # 回應快取共用記憶系統已載入的嵌入模型
+            self.response_cache = GenerativeCache(self.memory_bot.memory_manager.memory_system.model)
         except Exception as e:
             print(f"❌ 記憶系統初始化失敗: {e}")
             QMessageBox.critical(None, "錯誤", f"記憶系統初始化失敗：{str(e)}")
@@ -46,7 +87,7 @@ class SmartDesktopPetApp:
     def _init_llm_manager(self):
         """初始化LLM管理器"""
         try:
-            self.llm_manager = LLMAPIManager()
+            self.llm_manager = LLMAPIManager(cache=self.response_cache)
             print("✅ LLM管理器初始化成功")
         except Exception as e:
             print(f"❌ LLM管理器初始化失敗: {e}")
@@ -127,6 +168,9 @@ class SmartDesktopPetApp:
         try:
             result, llm_context, relevant_memories = self.memory_bot.process_input(command)
             
+            if result['memory_action'] != 'none' and self.response_cache:
+                self.response_cache.clear()
+            
             if result['has_response']:
                 # 在對話視窗中顯示結果
                 if self.chat_dialog and self.chat_dialog.isVisible():
@@ -158,31 +202,41 @@ class SmartDesktopPetApp:
             return
         
         try:
-            # 使用記憶系統處理用戶輸入
-            result, llm_context, relevant_memories = self.memory_bot.process_input(user_input)
-            
-            # 如果系統已經有回應（如記憶管理命令），直接顯示
+            # 記憶管理指令（刪除、列出、統計）直接由系統回應
+            result = self.memory_bot.classify_intent(user_input)
+            if result['memory_action'] == 'delete' and self.response_cache:
+                self.response_cache.clear()
             if result['has_response']:
                 self._show_system_response(result['response'], is_quick_chat)
                 return
             
+            # 先判斷是否為記憶指令（明確的「記住…」不必搜尋），取得相關記憶後立刻發出LLM請求
+            memory_decision = self.memory_bot.memory_manager.should_remember(user_input.strip())
+            llm_context, relevant_memories = self.memory_bot.retrieve_context(user_input, memory_decision)
+            
             # 顯示記憶資訊（調試用）
             if relevant_memories:
                 print(f"🧠 找到 {len(relevant_memories)} 條相關記憶:")
                 for memory in relevant_memories:
                     print(f"   - {memory['text'][:50]}...")
             
-            if result['memory_action'] == 'add':
-                print(f"💾 新增記憶 ID: {result['memory_id']}")
+            # 對話視窗開著時改用串流，邊收邊顯示
+            on_token = None
+            if not is_quick_chat and self.chat_dialog and self.chat_dialog.isVisible():
+                on_token = self.chat_dialog.append_to_last_pet_message
             
             # 發送到LLM
             success = self.llm_manager.send_request(
                 user_input=user_input,
                 context=llm_context,
                 on_success=lambda response: self._handle_llm_success(response, is_quick_chat),
-                on_error=lambda error: self._handle_llm_error(error, is_quick_chat)
+                on_error=lambda error: self._handle_llm_error(error, is_quick_chat),
+                on_token=on_token
             )
             
+            # 記憶判斷與存檔和網路請求同時在背景進行
+            self.memory_pool.start(_MemoryWriteTask(self.memory_bot, user_input, self.response_cache, memory_decision))
+            
             if not success:
                 self._show_error_response("啟動LLM請求失敗", is_quick_chat)
             
@@ -246,10 +300,17 @@ class SmartDesktopPetApp:
         """處理退出請求"""
         try:
             print("正在保存記憶系統...")
+            self.memory_pool.waitForDone()
             if self.memory_bot:
                 self.memory_bot._save_memory()
             print("記憶系統已保存")
             
+            if self.response_cache:
+                self.response_cache.save_to_disk()
+            
+            if self.llm_manager:
+                self.llm_manager.shutdown()
+            
             if self.chat_dialog:
                 self.chat_dialog.close()
             
@@ -277,6 +338,7 @@ def main():
     
     # 載入環境變數
     load_dotenv()
+    reload_api_key()
     
     # 檢查API Key（警告而不是阻止運行）
     if not check_api_key():
@@ -286,16 +348,6 @@ def main():
                           "桌寵仍可正常顯示，但無法與LLM對話。\n"
                           "記憶系統功能仍可正常使用。")
     
-    # 檢查記憶系統依賴
-    try:
-        from sentence_transformers import SentenceTransformer
-        print("✅ 記憶系統依賴檢查完成")
-    except ImportError:
-        QMessageBox.warning(None, "警告", 
-                          "記憶系統依賴未完整安裝！\n"
-                          "請執行：pip install sentence-transformers faiss-cpu\n"
-                          "桌寵將使用簡化的記憶功能。")
-    
     try:
         # 創建並啟動應用程式
         pet_app = SmartDesktopPetApp()
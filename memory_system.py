@@ -3,21 +3,40 @@
 整合記憶儲存、搜索、刪除和自動檢測功能
 
 依賴套件:
-pip install sentence-transformers faiss-cpu numpy pickle-mixin
+pip install sentence-transformers faiss-cpu numpy orjson
 
 如需 GPU 加速：
 pip install faiss-gpu
+
+如需改用 ONNX Runtime（int8 量化，USE_ONNX=1）：
+pip install onnxruntime transformers
+optimum-cli export onnx --model sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2 \
+    --task feature-extraction --optimize O3 onnx_model/
+optimum-cli onnxruntime quantize --onnx_model onnx_model/ --avx512_vnni -o onnx_model/
 """
 
 import os
 import re
+import glob
 import time
 import json
 import pickle
+import hashlib
+import threading
+import orjson
+from collections import OrderedDict
 import numpy as np
 from typing import List, Dict, Tuple, Optional, Union
-from sentence_transformers import SentenceTransformer
-import jieba
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    # 沒裝的話記憶系統改用簡化的文字比對模式（見 AdvancedMemorySystem）
+    SentenceTransformer = None
+try:
+    import ahocorasick
+except ImportError:
+    # 沒裝 pyahocorasick 的話關鍵詞偵測改用預先編好的正則
+    ahocorasick = None
 
 try:
     import faiss
@@ -28,45 +47,221 @@ except ImportError:
         class IndexFlatIP:
             def __init__(self, dimension):
                 self.dimension = dimension
-                self.data = []
+                self._rows = np.empty((0, dimension), dtype='float32')  # 每列都已正規化，容量不足時加倍
+                self.ntotal = 0
+            @property
+            def data(self):
+                return self._rows[:self.ntotal]
+            @data.setter
+            def data(self, rows):
+                self._rows = np.asarray(rows, dtype='float32').reshape(-1, self.dimension)
+                self.ntotal = len(self._rows)
             def add(self, embedding):
-                self.data.append(embedding[0])
+                embedding = np.asarray(embedding, dtype='float32').reshape(-1, self.dimension)
+                norms = np.linalg.norm(embedding, axis=1, keepdims=True)
+                norms[norms == 0] = 1
+                needed = self.ntotal + len(embedding)
+                if needed > len(self._rows):
+                    rows = np.empty((max(needed, 2 * len(self._rows)), self.dimension), dtype='float32')
+                    rows[:self.ntotal] = self.data
+                    self._rows = rows
+                self._rows[self.ntotal:needed] = embedding / norms
+                self.ntotal = needed
+            def reconstruct_n(self, start, count):
+                return self.data[start:start + count].copy()
+            def search(self, query, k):
+                if not self.ntotal:
+                    return np.array([[0.0]]), np.array([[-1]])
+                # cosine 相似度：存的列已正規化，只需正規化查詢
+                q = np.asarray(query[0], dtype='float32')
+                scores = self.data @ (q / (np.linalg.norm(q) or 1))
+                k = min(k, self.ntotal)
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                return scores[top][None, :], top[None, :]
+        class IndexIDMap2:
+            def __init__(self, index):
+                self.index = index
+                self.ids = []
+            @property
+            def ntotal(self):
+                return self.index.ntotal
+            def add_with_ids(self, embedding, ids):
+                self.index.add(embedding)
+                self.ids.extend(int(i) for i in ids)
+            def remove_ids(self, ids):
+                removed = set(int(i) for i in ids)
+                keep = [i for i, memory_id in enumerate(self.ids) if memory_id not in removed]
+                count = len(self.ids) - len(keep)
+                self.index.data = self.index.data[keep]
+                self.ids = [self.ids[i] for i in keep]
+                return count
             def search(self, query, k):
-                if not self.data:
-                    return np.array([[0.0]]), np.array([[0]])
-                # 簡單的相似度計算
-                scores = []
-                for i, vec in enumerate(self.data):
-                    if len(vec) == len(query[0]):
-                        score = np.dot(query[0], vec) / (np.linalg.norm(query[0]) * np.linalg.norm(vec))
-                        scores.append((score, i))
-                scores.sort(reverse=True)
-                scores = scores[:k]
-                return (np.array([[s[0] for s in scores]]), 
-                       np.array([[s[1] for s in scores]]))
+                scores, rows = self.index.search(query, k)
+                if not self.ids:
+                    return scores, np.array([[-1]])
+                return scores, np.array([[self.ids[r] for r in rows[0]]])
         @staticmethod
         def write_index(index, filepath):
+            if isinstance(index, MockFaiss.IndexIDMap2):
+                data = {'data': index.index.data, 'ids': index.ids}
+            else:
+                data = index.data
             with open(filepath, 'wb') as f:
-                pickle.dump(index.data, f)
+                pickle.dump(data, f)
         @staticmethod
         def read_index(filepath):
             idx = MockFaiss.IndexFlatIP(768)  # 默認維度
             try:
                 with open(filepath, 'rb') as f:
-                    idx.data = pickle.load(f)
+                    data = pickle.load(f)
+                ids = None
+                if isinstance(data, dict):
+                    data, ids = data['data'], data['ids']
+                rows = np.asarray(data, dtype='float32')
+                if rows.ndim == 2:
+                    idx = MockFaiss.IndexFlatIP(rows.shape[1])
+                idx.data = rows
+                if ids is not None:
+                    idx = MockFaiss.IndexIDMap2(idx)
+                    idx.ids = ids
             except:
                 pass
             return idx
     faiss = MockFaiss()
 
 
+# 新記憶先累積起來，一次送進模型編碼（搜尋 / 存檔前也會先送出）
+ENCODE_FLUSH_SIZE = 32
+ENCODE_BATCH_SIZE = 64
+
+# 記憶數量在這之下直接用 numpy 矩陣乘法搜尋（單一 BLAS 呼叫比 FAISS 的單查詢路徑快），超過才交給 FAISS
+# （FAISS 索引也是超過才建立，平常 fp16 矩陣是唯一一份向量）
+FAISS_SEARCH_THRESHOLD = 100_000
+# 有 CUDA 時，記憶數量超過這個值改在 GPU 上搜尋（太少的話傳輸成本比計算還高）
+GPU_SEARCH_THRESHOLD = 50_000
+# 嵌入矩陣以 fp16 存放；計算相似度時每次取這麼多列轉回 fp32 交給 BLAS
+SCORE_CHUNK_ROWS = 4096
+# 存檔平常只把新增 / 刪除追加到日誌；日誌超過這麼多行（或清理過記憶）才重寫完整快照
+LOG_COMPACT_LINES = 1000
+# 搜尋結果快取：同樣的查詢直接回傳；語意幾乎相同（cosine 超過門檻）的查詢也沿用上次的結果
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_SIMILARITY = 0.98
+# 明確的「記住…」（信心度超過這個值）只需存入，不必先編碼搜尋相關記憶
+EXPLICIT_SKIP_SEARCH_CONFIDENCE = 0.9
+# USE_ONNX=1 時以 ONNX Runtime 執行匯出的模型取代 SentenceTransformer（第一次編碼才載入）
+USE_ONNX = os.getenv("USE_ONNX") == "1"
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_model")
+# 與 SentenceTransformer 版本的 max_seq_length 相同
+ONNX_MAX_LENGTH = 128
+
+
+# jieba 載入詞典要花約一秒與數十 MB 記憶體：只有簡化模式真的遇到中文時才載入
+_jieba = None
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+
+
+def _tokenize(text: str) -> List[str]:
+    """斷詞：含中文時用 jieba，其餘直接以空白切開"""
+    global _jieba
+    text = text.lower()
+    if not _CJK_RE.search(text):
+        return text.split()
+    if _jieba is None:
+        import jieba
+        jieba.initialize()
+        _jieba = jieba
+    return [token for token in _jieba.lcut(text) if token.strip()]
+
+
+class ONNXEncoder:
+    """
+    以 ONNX Runtime 執行匯出的句向量模型（mean pooling），encode 介面與 SentenceTransformer 相容
+    
+    建構時只讀 config.json 取得維度，tokenizer 與 InferenceSession 到第一次 encode 才載入
+    """
+    
+    # 依序找量化版 → 最佳化版 → 原始匯出（依檔名結尾判斷）
+    MODEL_SUFFIXES = ('quantized.onnx', 'optimized.onnx', '.onnx')
+    
+    def __init__(self, model_dir: str):
+        self.model_dir = model_dir
+        with open(os.path.join(model_dir, 'config.json'), encoding='utf-8') as f:
+            self.dimension = json.load(f)['hidden_size']
+        self._tokenizer = None
+        self._session = None
+        self._input_names = ()
+        self._lock = threading.Lock()
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+    
+    def _load(self):
+        """載入 tokenizer 與 ONNX 模型"""
+        with self._lock:
+            if self._session is not None:
+                return
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+            
+            files = sorted(os.listdir(self.model_dir))
+            path = next((os.path.join(self.model_dir, name) for suffix in self.MODEL_SUFFIXES
+                         for name in files if name.endswith(suffix)), None)
+            if path is None:
+                raise FileNotFoundError(f"{self.model_dir} 中找不到 ONNX 模型")
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+            session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+            self._input_names = tuple(node.name for node in session.get_inputs())
+            self._session = session
+            print(f"已載入 ONNX 模型: {path}")
+    
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               convert_to_numpy: bool = True, normalize_embeddings: bool = False,
+               show_progress_bar: bool = False) -> np.ndarray:
+        """編碼文字，回傳 float32 向量（單一字串回傳一維，列表回傳二維）"""
+        if self._session is None:
+            self._load()
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        # 與 SentenceTransformer 一樣依長度排序分批，減少 padding
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            tokens = self._tokenizer(
+                [texts[i] for i in batch],
+                padding=True,
+                truncation=True,
+                max_length=ONNX_MAX_LENGTH,
+                return_tensors='np'
+            )
+            feeds = {name: tokens[name].astype(np.int64) for name in self._input_names if name in tokens}
+            token_embeddings = self._session.run(None, feeds)[0]
+            mask = tokens['attention_mask'][..., None].astype(np.float32)
+            embeddings[batch] = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.maximum(norms, 1e-12)
+        return embeddings[0] if single else embeddings
+
+
 class AdvancedMemorySystem:
     """進階記憶系統 - 支援向量檢索和記憶管理"""
     
     def __init__(self, embedding_model_name='paraphrase-multilingual-MiniLM-L12-v2'):
         print(f"初始化記憶系統，載入模型: {embedding_model_name}")
+        self.embedding_model_name = embedding_model_name
         try:
-            self.model = SentenceTransformer(embedding_model_name)
+            if USE_ONNX:
+                self.model = ONNXEncoder(ONNX_MODEL_DIR)
+                # 量化後的向量與原模型略有差異，嵌入快取要分開
+                self.embedding_model_name = f"{embedding_model_name}@onnx"
+            elif SentenceTransformer is None:
+                raise ImportError("未安裝 sentence-transformers")
+            else:
+                self.model = SentenceTransformer(embedding_model_name)
             self.dimension = self.model.get_sentence_embedding_dimension()
         except Exception as e:
             print(f"無法載入嵌入模型: {e}")
@@ -74,38 +269,238 @@ class AdvancedMemorySystem:
             self.model = None
             self.dimension = 768
             
-        self.index = faiss.IndexFlatIP(self.dimension)
+        # 以記憶 ID 作為 FAISS 內的 ID，清理時可以直接 remove_ids（記憶超過 FAISS_SEARCH_THRESHOLD 才建立）
+        self.index = None
         self.memories = []
-        self.metadata = []
-        self.memory_ids = []
         self.next_id = 0
         self.deleted_ids = set()
+        # 每條記憶的欄位各存一個陣列（與 memories 同順序，容量不足時加倍）
+        self._reset_columns()
+        # metadata 的 type 字串轉成小整數存放
+        self._type_table = {}
+        self._type_names = []
+        # 已加入 memories 但還沒編碼進索引的文字（順序與 memories 尾端一致）
+        self._pending_texts = []
+        # 已正規化的嵌入矩陣（fp16，前 _n 列有效，容量不足時加倍）
+        self._matrix = np.empty((0, self.dimension), dtype=np.float16)
+        self._n = 0
+        # 計算相似度時重複使用的 fp32 暫存區（第一次搜尋才配置）
+        self._chunk_buffer = None
+        # GPU 上的矩陣副本（fp16，只在記憶很多且有 CUDA 時才建立，新增的列之後再補上去）
+        self._torch = None
+        self._cuda_checked = False
+        self._gpu_matrix = None
+        # 內容 SHA-256 → 嵌入向量（float16），同樣的文字不必再跑一次模型
+        self._emb_cache = {}
+        self._emb_cache_dirty = False
+        # 搜尋結果快取（記憶有任何變動就清空）：完全相同的查詢 → 結果；最近查詢的 embedding 環形緩衝
+        self._search_cache = OrderedDict()
+        self._recent_queries = np.zeros((SEARCH_CACHE_SIZE, self.dimension), dtype='float32')
+        self._recent_results = [None] * SEARCH_CACHE_SIZE
+        self._recent_count = 0
+        # 增量存檔的狀態：已寫到磁碟的記憶數與刪除、日誌行數、是否需要重寫快照
+        self._persisted_count = 0
+        self._persisted_deleted = set()
+        self._log_lines = 0
+        self._snapshot_stale = True
+        # 快照世代：.npz 檔名與兩個檔案內都帶著它，載入時用來確認 .json 與 .npz 是同一次寫入的
+        self._generation = 0
+        
+    @property
+    def memory_ids(self) -> List[int]:
+        """各記憶的 ID（與 memories 同順序）"""
+        return self._id[:len(self.memories)].tolist()
+    
+    @property
+    def metadata(self) -> List[Dict]:
+        """各記憶的 metadata（與 memories 同順序，每次呼叫都會重新組出 dict）"""
+        return [self._metadata_at(i) for i in range(len(self.memories))]
+    
+    def _metadata_at(self, position: int) -> Dict:
+        """組出單一記憶的 metadata"""
+        metadata = dict(self._meta_extra[position])
+        metadata['timestamp'] = float(self._ts[position])
+        type_id = self._type_id[position]
+        if type_id >= 0:
+            metadata['type'] = self._type_names[type_id]
+        return metadata
+    
+    def _reset_columns(self, capacity: int = 0):
+        """清空欄位陣列（預留 capacity 條的空間）"""
+        self._id = np.zeros(capacity, dtype=np.int64)
+        self._ts = np.zeros(capacity, dtype=np.float64)
+        self._type_id = np.full(capacity, -1, dtype=np.int16)
+        self._deleted = np.zeros(capacity, dtype=bool)
+        self._meta_extra = []
+        self._token_sets = []
+        # 記憶 ID → 在陣列中的位置（只含未刪除的）
+        self._id_to_pos = {}
+    
+    def _append_columns(self, memory_id: int, metadata: Dict):
+        """把一條記憶的 ID 與 metadata 寫進欄位陣列（memories 須已 append）"""
+        position = len(self.memories) - 1
+        if position >= len(self._id):
+            capacity = max(2 * len(self._id), 64)
+            for name in ('_id', '_ts', '_type_id', '_deleted'):
+                old = getattr(self, name)
+                grown = np.full(capacity, -1 if name == '_type_id' else 0, dtype=old.dtype)
+                grown[:len(old)] = old
+                setattr(self, name, grown)
+        
+        extra = dict(metadata)
+        memory_type = extra.pop('type', None)
+        self._id[position] = memory_id
+        self._id_to_pos[memory_id] = position
+        self._ts[position] = extra.pop('timestamp', 0)
+        self._deleted[position] = False
+        if memory_type is not None:
+            if memory_type not in self._type_table:
+                self._type_table[memory_type] = len(self._type_names)
+                self._type_names.append(memory_type)
+            self._type_id[position] = self._type_table[memory_type]
+        else:
+            self._type_id[position] = -1
+        self._meta_extra.append(extra)
+    
+    def _memory_token_sets(self) -> List[frozenset]:
+        """各記憶的詞集合（簡化模式用；每條只斷詞一次，搜尋時才補上新記憶的部分）"""
+        for text in self.memories[len(self._token_sets):]:
+            self._token_sets.append(frozenset(_tokenize(text)))
+        return self._token_sets
+    
+    def _simple_scores(self, query: str) -> np.ndarray:
+        """簡單的文字相似度計算（當沒有嵌入模型時使用）：查詢與每條記憶詞集合的 Jaccard"""
+        query_tokens = frozenset(_tokenize(query))
+        token_sets = self._memory_token_sets()
+        return np.fromiter(
+            (len(query_tokens & tokens) / len(query_tokens | tokens) if query_tokens or tokens else 0.0
+             for tokens in token_sets),
+            dtype=np.float32,
+            count=len(token_sets)
+        )
+    
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """每個查詢（每一列）取分數最高的 k 個（由高到低），回傳 (分數, 位置)，形狀與 FAISS 的 search 相同"""
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+    
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """批次編碼並正規化（內積即 cosine 相似度）"""
+        # SentenceTransformer.encode 內部已依長度排序分批，一次丟進全部文字即可避免 padding 浪費
+        return self.model.encode(
+            texts,
+            batch_size=ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+    
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """編碼記憶內容：編碼過的直接取快取，只把沒看過的文字送進模型"""
+        keys = [hashlib.sha256(text.encode('utf-8')).hexdigest() for text in texts]
+        missing = {key: text for key, text in zip(keys, texts) if key not in self._emb_cache}
+        if missing:
+            embeddings = self._encode(list(missing.values()))
+            for key, embedding in zip(missing, embeddings):
+                self._emb_cache[key] = embedding.astype(np.float16)
+            self._emb_cache_dirty = True
+        return np.stack([self._emb_cache[key] for key in keys], dtype='float32')
+    
+    def _append_rows(self, embeddings: np.ndarray):
+        """把新的嵌入向量接到矩陣尾端"""
+        needed = self._n + len(embeddings)
+        if needed > len(self._matrix):
+            capacity = max(needed, 2 * len(self._matrix), 64)
+            matrix = np.empty((capacity, self.dimension), dtype=np.float16)
+            matrix[:self._n] = self._matrix[:self._n]
+            self._matrix = matrix
+        self._matrix[self._n:needed] = embeddings
+        self._n = needed
+    
+    def _set_vectors(self, vectors: np.ndarray):
+        """以整批（已正規化、與 memories 同順序的）向量重建矩陣（FAISS 索引等搜尋需要時再建）"""
+        self.index = None
+        self._matrix = np.empty((0, self.dimension), dtype=np.float16)
+        self._n = 0
+        self._gpu_matrix = None
+        if len(vectors):
+            self._append_rows(vectors)
+    
+    def _faiss_index(self):
+        """回傳 FAISS 索引，第一次用到時才由 fp16 矩陣分塊建立"""
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+            for start in range(0, self._n, SCORE_CHUNK_ROWS):
+                end = min(start + SCORE_CHUNK_ROWS, self._n)
+                self.index.add_with_ids(self._matrix[start:end].astype('float32'), self._id[start:end])
+        return self.index
+    
+    def _add_vectors(self, embeddings: np.ndarray):
+        """新的嵌入向量接到矩陣尾端（索引已建立的話也一併加入）"""
+        if self.index is not None:
+            self.index.add_with_ids(embeddings, self._id[self._n:self._n + len(embeddings)])
+        self._append_rows(embeddings)
+    
+    def _cuda_torch(self):
+        """有 CUDA 可用時回傳 torch 模組，否則 None（只偵測一次）"""
+        if not self._cuda_checked:
+            self._cuda_checked = True
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    self._torch = torch
+            except ImportError:
+                pass
+        return self._torch
+    
+    def _gpu_search(self, torch, query_embeddings: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """在 GPU 上計算（多個查詢的）相似度並各取前 k 名"""
+        rows = 0 if self._gpu_matrix is None else len(self._gpu_matrix)
+        if rows < self._n:
+            new_rows = torch.from_numpy(self._matrix[rows:self._n]).to('cuda')
+            self._gpu_matrix = new_rows if self._gpu_matrix is None else torch.cat([self._gpu_matrix, new_rows])
+        
+        queries = torch.from_numpy(query_embeddings).to('cuda', dtype=torch.float16)
+        scores = queries @ self._gpu_matrix.T
+        scores[:, torch.from_numpy(self._deleted[:self._n]).to('cuda')] = float('-inf')
+        values, top = scores.topk(min(k, self._n), dim=1)
+        return values.float().cpu().numpy(), top.cpu().numpy()
+    
+    def _matrix_scores(self, query_embeddings: np.ndarray) -> np.ndarray:
+        """計算每個查詢與所有記憶的相似度，形狀 (查詢數, 記憶數)（分塊轉 fp32，不必複製整個矩陣）"""
+        if self._chunk_buffer is None:
+            self._chunk_buffer = np.empty((SCORE_CHUNK_ROWS, self.dimension), dtype='float32')
+        scores = np.empty((len(query_embeddings), self._n), dtype='float32')
+        for start in range(0, self._n, SCORE_CHUNK_ROWS):
+            end = min(start + SCORE_CHUNK_ROWS, self._n)
+            chunk = self._chunk_buffer[:end - start]
+            np.copyto(chunk, self._matrix[start:end])
+            np.matmul(query_embeddings, chunk.T, out=scores[:, start:end])
+        return scores
+    
+    def _flush(self):
+        """把累積的新記憶一次編碼並加入索引"""
+        if not self._pending_texts:
+            return
+        texts, self._pending_texts = self._pending_texts, []
         
-    def _simple_similarity(self, text1: str, text2: str) -> float:
-        """簡單的文字相似度計算（當沒有嵌入模型時使用）"""
-        words1 = set(text1.lower().split())
-        words2 = set(text2.lower().split())
-        if not words1 and not words2:
-            return 0.0
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
-        return len(intersection) / len(union) if union else 0.0
-        
-    def add_memory(self, text: str, metadata: Dict = None) -> int:
-        """添加記憶並返回記憶 ID"""
-        if not text.strip():
-            return -1
-            
         if self.model:
-            embedding = self.model.encode([text])
-            self.index.add(embedding.astype('float32'))
+            embeddings = self._embed(texts)
         else:
             # 使用假的嵌入向量
-            fake_embedding = np.random.rand(1, self.dimension).astype('float32')
-            self.index.add(fake_embedding)
-        
+            embeddings = np.random.rand(len(texts), self.dimension)
+        self._add_vectors(embeddings.astype('float32', copy=False))
+    
+    def _append_memory(self, text: str, metadata: Dict = None) -> int:
+        """登記一條記憶（先不編碼），返回記憶 ID"""
         memory_id = self.next_id
         self.memories.append(text)
+        self._pending_texts.append(text)
+        self._invalidate_search_cache()
         
         # 添加時間戳
         if metadata is None:
@@ -113,26 +508,43 @@ class AdvancedMemorySystem:
         metadata['timestamp'] = metadata.get('timestamp', time.time())
         metadata['created_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
         
-        self.metadata.append(metadata)
-        self.memory_ids.append(memory_id)
+        self._append_columns(memory_id, metadata)
         self.next_id += 1
         
         return memory_id
+        
+    def add_memory(self, text: str, metadata: Dict = None) -> int:
+        """添加記憶並返回記憶 ID"""
+        if not text.strip():
+            return -1
+        
+        memory_id = self._append_memory(text, metadata)
+        if len(self._pending_texts) >= ENCODE_FLUSH_SIZE:
+            self._flush()
+        
+        return memory_id
+    
+    def add_memories_bulk(self, texts: List[str], metadatas: List[Dict] = None) -> List[int]:
+        """一次添加多條記憶（只做一次批次編碼），返回各自的記憶 ID（空白文字為 -1）"""
+        if metadatas is None:
+            metadatas = [None] * len(texts)
+        
+        memory_ids = [
+            self._append_memory(text, metadata) if text.strip() else -1
+            for text, metadata in zip(texts, metadatas)
+        ]
+        self._flush()
+        return memory_ids
     
     def delete_memory_by_id(self, memory_id: int) -> bool:
-        """根據 ID 刪除記憶"""
-        try:
-            index_position = self.memory_ids.index(memory_id)
-            self.deleted_ids.add(memory_id)
-            self.memories[index_position] = "[DELETED]"
-            self.metadata[index_position] = {
-                "deleted": True, 
-                "deleted_at": time.time(),
-                "deleted_at_str": time.strftime('%Y-%m-%d %H:%M:%S')
-            }
-            return True
-        except ValueError:
+        """根據 ID 刪除記憶（只做標記，內容保留到 cleanup_deleted_memories 才真正移除）"""
+        position = self._id_to_pos.pop(memory_id, None)
+        if position is None:
             return False
+        self._deleted[position] = True
+        self.deleted_ids.add(memory_id)
+        self._invalidate_search_cache()
+        return True
     
     def delete_memories_by_content(self, search_text: str, threshold: float = 0.8) -> List[int]:
         """根據內容相似度刪除記憶"""
@@ -141,7 +553,7 @@ class AdvancedMemorySystem:
         
         for memory in similar_memories:
             memory_idx = memory['index']
-            memory_id = self.memory_ids[memory_idx]
+            memory_id = int(self._id[memory_idx])
             
             if self.delete_memory_by_id(memory_id):
                 deleted_ids.append(memory_id)
@@ -151,15 +563,16 @@ class AdvancedMemorySystem:
     def delete_recent_memories(self, hours: int = 24) -> List[int]:
         """刪除最近指定時間內的記憶"""
         cutoff_time = time.time() - (hours * 3600)
-        deleted_ids = []
+        count = len(self.memories)
         
-        for memory_id, metadata in zip(self.memory_ids, self.metadata):
-            if memory_id in self.deleted_ids:
-                continue
-                
-            if metadata.get('timestamp', 0) > cutoff_time:
-                if self.delete_memory_by_id(memory_id):
-                    deleted_ids.append(memory_id)
+        mask = (self._ts[:count] > cutoff_time) & ~self._deleted[:count]
+        deleted_ids = self._id[:count][mask].tolist()
+        self._deleted[:count] |= mask
+        self.deleted_ids.update(deleted_ids)
+        for memory_id in deleted_ids:
+            del self._id_to_pos[memory_id]
+        if deleted_ids:
+            self._invalidate_search_cache()
         
         return deleted_ids
     
@@ -168,74 +581,134 @@ class AdvancedMemorySystem:
         if not self.deleted_ids:
             return
         
-        valid_memories = []
-        valid_metadata = []
-        valid_ids = []
-        
-        for memory, metadata, memory_id in zip(self.memories, self.metadata, self.memory_ids):
-            if memory_id not in self.deleted_ids and memory != "[DELETED]":
-                valid_memories.append(memory)
-                valid_metadata.append(metadata)
-                valid_ids.append(memory_id)
-        
-        self.memories = valid_memories
-        self.metadata = valid_metadata
-        self.memory_ids = valid_ids
+        self._flush()
+        keep = np.flatnonzero(~self._deleted[:len(self.memories)])
+        
+        self.memories = [self.memories[i] for i in keep]
+        self._meta_extra = [self._meta_extra[i] for i in keep]
+        # 詞集合可能只補到前面一部分；keep 由小到大，留下的仍是新列表的前段
+        self._token_sets = [self._token_sets[i] for i in keep if i < len(self._token_sets)]
+        self._id, self._ts, self._type_id = self._id[keep], self._ts[keep], self._type_id[keep]
+        self._deleted = np.zeros(len(keep), dtype=bool)
+        self._id_to_pos = {int(memory_id): position for position, memory_id in enumerate(self._id)}
+        
+        # 保留下來的向量直接取出，不必重新編碼；FAISS 只移除已刪除的 ID（數量降到門檻以下就不再保留索引）
+        self._matrix = self._matrix[keep]
+        self._n = len(keep)
+        if self._n <= FAISS_SEARCH_THRESHOLD:
+            self.index = None
+        elif self.index is not None:
+            self.index.remove_ids(np.array(sorted(self.deleted_ids), dtype=np.int64))
+        self._gpu_matrix = None
         self.deleted_ids.clear()
-        
-        # 重建 FAISS 索引
-        self.index = faiss.IndexFlatIP(self.dimension)
-        if self.memories:
-            if self.model:
-                embeddings = self.model.encode(self.memories)
-                self.index.add(embeddings.astype('float32'))
-            else:
-                # 使用假的嵌入向量
-                fake_embeddings = np.random.rand(len(self.memories), self.dimension).astype('float32')
-                self.index.add(fake_embeddings)
+        self._snapshot_stale = True  # 位置都變了，下次存檔重寫快照
+        self._invalidate_search_cache()
         
         print(f"清理完成，剩餘 {len(self.memories)} 條記憶")
     
+    def _invalidate_search_cache(self):
+        """記憶有新增、刪除或重新載入時呼叫，之前的搜尋結果都不再可信"""
+        self._search_cache.clear()
+        self._recent_count = 0
+    
+    def _cached_search(self, key: Tuple, query_embedding: Optional[np.ndarray]) -> Optional[List[Dict]]:
+        """查詢搜尋結果快取：先比對完全相同的查詢，再比對語意幾乎相同的查詢"""
+        if key in self._search_cache:
+            return list(self._search_cache[key])
+        if query_embedding is None or not self._recent_count:
+            return None
+        
+        count = min(self._recent_count, SEARCH_CACHE_SIZE)
+        similarities = self._recent_queries[:count] @ query_embedding
+        for slot in np.flatnonzero(similarities > SEARCH_CACHE_SIMILARITY):
+            cached_key, results = self._recent_results[slot]
+            if cached_key[1:] == key[1:]:  # top_k、threshold 要一樣
+                return list(results)
+        return None
+    
+    def _store_search(self, key: Tuple, query_embedding: Optional[np.ndarray], results: List[Dict]):
+        self._search_cache[key] = results
+        if len(self._search_cache) > SEARCH_CACHE_SIZE:
+            self._search_cache.popitem(last=False)
+        if query_embedding is not None:
+            slot = self._recent_count % SEARCH_CACHE_SIZE
+            self._recent_queries[slot] = query_embedding
+            self._recent_results[slot] = (key, results)
+            self._recent_count += 1
+    
     def search_memories(self, query: str, top_k: int = 5, threshold: float = 0.7) -> List[Dict]:
-        """搜索記憶（排除已刪除的）"""
+        """搜索記憶（排除已刪除的）；重複或語意幾乎相同的查詢直接沿用上次的結果"""
+        return self.search_memories_batch([query], top_k, threshold)[0]
+    
+    def search_memories_batch(self, queries: List[str], top_k: int = 5, threshold: float = 0.7) -> List[List[Dict]]:
+        """
+        一次搜索多個查詢（查詢一起編碼、一起算相似度，比逐一呼叫 search_memories 快）
+        
+        Returns:
+            與 queries 同順序的搜尋結果列表
+        """
         if len(self.memories) == 0:
-            return []
+            return [[] for _ in queries]
         
+        keys = [(query, top_k, threshold) for query in queries]
+        results = [self._cached_search(key, None) for key in keys]
+        todo = [i for i, cached in enumerate(results) if cached is None]
+        if not todo:
+            return results
+        
+        self._flush()
+        
+        query_embeddings = None
         if self.model:
-            query_embedding = self.model.encode([query])
-            scores, indices = self.index.search(
-                query_embedding.astype('float32'), 
-                min(top_k * 2, len(self.memories))
-            )
+            encoded = self._encode([queries[i] for i in todo])
+            remaining = []
+            for i, embedding in zip(todo, encoded):
+                results[i] = self._cached_search(keys[i], embedding)
+                if results[i] is None:
+                    remaining.append((i, embedding))
+            if not remaining:
+                return results
+            todo = [i for i, _ in remaining]
+            query_embeddings = np.stack([embedding for _, embedding in remaining])
+            
+            torch = self._cuda_torch() if self._n > GPU_SEARCH_THRESHOLD else None
+            if torch is not None:
+                scores, indices = self._gpu_search(torch, query_embeddings, top_k)
+            elif self._n > FAISS_SEARCH_THRESHOLD:
+                scores, ids = self._faiss_index().search(query_embeddings, min(top_k * 2, self._n))
+                # FAISS 回傳的是記憶 ID，換成位置（已刪除的不在表中 → -1）
+                indices = np.array([[self._id_to_pos.get(int(i), -1) for i in row] for row in ids])
+            else:
+                # 已刪除的直接壓到 -inf，只需要取 top_k 個
+                all_scores = self._matrix_scores(query_embeddings)
+                all_scores[:, self._deleted[:self._n]] = -np.inf
+                scores, indices = self._top_k(all_scores, top_k)
         else:
             # 使用簡單相似度計算
-            similarities = []
-            for i, memory in enumerate(self.memories):
-                if self.memory_ids[i] not in self.deleted_ids and memory != "[DELETED]":
-                    sim = self._simple_similarity(query, memory)
-                    similarities.append((sim, i))
-            
-            similarities.sort(reverse=True)
-            scores = np.array([[s[0] for s in similarities[:min(top_k * 2, len(similarities))]]])
-            indices = np.array([[s[1] for s in similarities[:min(top_k * 2, len(similarities))]]])
-        
+            all_scores = np.stack([self._simple_scores(queries[i]) for i in todo])
+            all_scores[:, self._deleted[:all_scores.shape[1]]] = -np.inf
+            scores, indices = self._top_k(all_scores, top_k)
+        
+        for row, i in enumerate(todo):
+            found = self._collect_results(scores[row], indices[row], top_k, threshold)
+            self._store_search(keys[i], None if query_embeddings is None else query_embeddings[row], found)
+            results[i] = list(found)
+        return results
+    
+    def _collect_results(self, scores: np.ndarray, indices: np.ndarray, top_k: int, threshold: float) -> List[Dict]:
+        """把一個查詢的 (分數, 位置) 整理成搜尋結果"""
         results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx >= len(self.memories):
+        for score, idx in zip(scores, indices):
+            if idx < 0 or idx >= len(self.memories) or self._deleted[idx]:
                 continue
-                
-            memory_id = self.memory_ids[idx]
             
-            if memory_id in self.deleted_ids or self.memories[idx] == "[DELETED]":
-                continue
-                
             if score >= threshold:
                 results.append({
-                    'id': memory_id,
+                    'id': int(self._id[idx]),
                     'text': self.memories[idx],
                     'score': float(score),
-                    'metadata': self.metadata[idx],
-                    'index': idx
+                    'metadata': self._metadata_at(idx),
+                    'index': int(idx)
                 })
                 
                 if len(results) >= top_k:
@@ -261,7 +734,7 @@ class AdvancedMemorySystem:
     
     def get_memory_stats(self) -> Dict:
         """取得記憶統計資訊"""
-        total_memories = len(self.memory_ids)
+        total_memories = len(self.memories)
         deleted_memories = len(self.deleted_ids)
         active_memories = total_memories - deleted_memories
         
@@ -273,52 +746,286 @@ class AdvancedMemorySystem:
         }
     
     def save_to_disk(self, filepath: str):
-        """保存記憶系統到本地端"""
+        """保存記憶系統到本地端（平常只追加這次的變動，必要時才重寫完整快照）"""
         try:
-            # 保存 FAISS 索引
-            faiss.write_index(self.index, f"{filepath}.index")
+            self._flush()
             
-            # 保存其他資料
-            with open(f"{filepath}.pkl", 'wb') as f:
-                pickle.dump({
-                    'memories': self.memories,
-                    'metadata': self.metadata,
-                    'memory_ids': self.memory_ids,
-                    'next_id': self.next_id,
-                    'deleted_ids': self.deleted_ids
-                }, f)
+            if (self._snapshot_stale or self._log_lines >= LOG_COMPACT_LINES
+                    or not os.path.exists(f"{filepath}.json")):
+                self._write_snapshot(filepath)
+            else:
+                self._append_log(filepath)
             
             print(f"記憶系統已保存到 {filepath}")
             
         except Exception as e:
             print(f"保存失敗: {e}")
     
+    def _write_snapshot(self, filepath: str):
+        """
+        寫入完整快照，並清掉已併入的日誌
+
+        .npz 以世代編號命名、寫成新檔，替換 .json 才算寫入完成（.json 記著要配哪一代的 .npz）；
+        中途中斷的話舊的 .json 仍指向舊的 .npz，日誌也還在
+        """
+        count = len(self.memories)
+        generation = self._generation + 1
+        npz_path = f"{filepath}.g{generation}.npz"
+        
+        # 嵌入矩陣與數值欄位：直接存陣列（FAISS 索引需要時再由矩陣建立，不另外存）
+        with open(f"{npz_path}.tmp", 'wb') as f:
+            np.savez_compressed(
+                f,
+                generation=np.int64(generation),
+                M=self._matrix[:self._n],
+                ids=self._id[:count],
+                ts=self._ts[:count],
+                type_id=self._type_id[:count],
+                deleted=self._deleted[:count]
+            )
+        os.replace(f"{npz_path}.tmp", npz_path)
+        
+        # 文字與其餘 metadata
+        with open(f"{filepath}.json.tmp", 'wb') as f:
+            f.write(orjson.dumps({
+                'generation': generation,
+                'memories': self.memories,
+                'meta_extra': self._meta_extra,
+                'type_names': self._type_names,
+                'next_id': self.next_id
+            }))
+        os.replace(f"{filepath}.json.tmp", f"{filepath}.json")
+        self._generation = generation
+        
+        # 舊世代的 .npz、沒有世代編號的 .npz，以及舊版（pickle + FAISS 索引）的存檔都已經被取代
+        stale = [path for path in glob.glob(f"{glob.escape(filepath)}.g*.npz") if path != npz_path]
+        for path in stale + [f"{filepath}.npz", f"{filepath}.index", f"{filepath}.pkl"]:
+            if os.path.exists(path):
+                os.remove(path)
+        for path in (f"{filepath}.log", f"{filepath}.vec"):
+            if os.path.exists(path):
+                os.remove(path)
+        
+        self._save_emb_cache(f"{filepath}.embcache.npz")
+        
+        self._persisted_count = len(self.memories)
+        self._persisted_deleted = set(self.deleted_ids)
+        self._log_lines = 0
+        self._snapshot_stale = False
+    
+    def _append_log(self, filepath: str):
+        """把上次存檔後新增的記憶與刪除追加到 {filepath}.log，向量追加到 {filepath}.vec"""
+        start, end = self._persisted_count, len(self.memories)
+        new_deleted = self.deleted_ids - self._persisted_deleted
+        if start == end and not new_deleted:
+            return
+        
+        records = []
+        if start < end:
+            vec_path = f"{filepath}.vec"
+            # 每筆記錄存自己在 .vec 中的列號，中途斷電留下的多餘列不會讓之後的記錄錯位
+            row_bytes = self.dimension * np.dtype(np.float16).itemsize
+            first_row = os.path.getsize(vec_path) // row_bytes if os.path.exists(vec_path) else 0
+            with open(vec_path, 'ab') as f:
+                f.write(self._matrix[start:end].tobytes())
+            records += [
+                {'id': int(self._id[i]), 'row': first_row + i - start,
+                 'text': self.memories[i], 'meta': self._metadata_at(i)}
+                for i in range(start, end)
+            ]
+        records += [{'del': memory_id} for memory_id in sorted(new_deleted)]
+        
+        with open(f"{filepath}.log", 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+        
+        self._persisted_count = end
+        self._persisted_deleted |= new_deleted
+        self._log_lines += len(records)
+    
+    def _replay_log(self, filepath: str):
+        """把快照之後追加的日誌重新套用回來"""
+        log_path, vec_path = f"{filepath}.log", f"{filepath}.vec"
+        if not os.path.exists(log_path):
+            return
+        
+        vectors = np.empty((0, self.dimension), dtype=np.float16)
+        if os.path.exists(vec_path) and os.path.getsize(vec_path):
+            vectors = np.memmap(vec_path, dtype=np.float16, mode='r').reshape(-1, self.dimension)
+        
+        known = set(self._id[:len(self.memories)].tolist())
+        rows, deletes = [], []
+        with open(log_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 寫到一半被中斷的最後一行
+                self._log_lines += 1
+                if 'del' in record:
+                    deletes.append(record['del'])
+                    continue
+                # 快照已經包含（替換快照後來不及刪日誌）或向量沒寫完整的記錄略過
+                if record['id'] in known or record['row'] >= len(vectors):
+                    continue
+                known.add(record['id'])
+                self.memories.append(record['text'])
+                self._append_columns(record['id'], record['meta'])
+                self.next_id = max(self.next_id, record['id'] + 1)
+                rows.append(record['row'])
+        
+        if rows:
+            self._add_vectors(np.asarray(vectors[rows], dtype='float32'))
+        for memory_id in deletes:
+            self.delete_memory_by_id(memory_id)
+    
+    def _save_emb_cache(self, path: str):
+        """保存嵌入快取（只留目前記憶用得到的內容）"""
+        if not self.model or not self._emb_cache_dirty:
+            return
+        live = {hashlib.sha256(text.encode('utf-8')).hexdigest() for text in self.memories}
+        self._emb_cache = {key: vec for key, vec in self._emb_cache.items() if key in live}
+        if self._emb_cache:
+            np.savez_compressed(
+                path,
+                model=np.array(self.embedding_model_name),
+                hashes=np.array(list(self._emb_cache)),
+                vectors=np.stack(list(self._emb_cache.values()))
+            )
+        self._emb_cache_dirty = False
+    
+    def _load_emb_cache(self, path: str):
+        """載入嵌入快取（換了模型就不用）"""
+        if not self.model or not os.path.exists(path):
+            return
+        with np.load(path) as data:
+            if str(data['model']) != self.embedding_model_name:
+                return
+            self._emb_cache = dict(zip(data['hashes'].tolist(), data['vectors']))
+    
+    def _load_index_vectors(self, index):
+        """
+        從讀進來的索引取出向量，依 memories 的順序排好並正規化後重建索引與矩陣
+        （舊版存檔是沒有 ID 的 IndexFlatIP，向量也沒有正規化）
+        """
+        ids = None
+        if isinstance(getattr(index, 'ids', None), list):  # MockFaiss
+            vectors, ids = index.index.data, index.ids
+        elif hasattr(index, 'id_map'):
+            inner = faiss.downcast_index(index.index)
+            vectors = inner.reconstruct_n(0, inner.ntotal)
+            ids = faiss.vector_to_array(index.id_map)
+        else:
+            vectors = index.reconstruct_n(0, index.ntotal)
+        vectors = vectors.reshape(-1, self.dimension)
+        
+        if ids is not None:
+            row_of = {int(memory_id): row for row, memory_id in enumerate(ids)}
+            vectors = vectors[[row_of[int(memory_id)] for memory_id in self._id[:len(self.memories)]]]
+        
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self._set_vectors((vectors / norms).astype('float32', copy=False))
+    
+    def _load_snapshot(self, filepath: str):
+        """載入快照（.npz 陣列 + .json 文字與 metadata），兩者不是同一次寫入的就拋出 ValueError"""
+        with open(f"{filepath}.json", 'rb') as f:
+            data = orjson.loads(f.read())
+        # 加入世代編號之前寫的快照只有一個 {filepath}.npz
+        generation = data.get('generation')
+        npz_path = f"{filepath}.npz" if generation is None else f"{filepath}.g{generation}.npz"
+        with np.load(npz_path) as arrays:
+            stored = int(arrays['generation']) if 'generation' in arrays.files else None
+            matrix = arrays['M']
+            ids, ts = arrays['ids'], arrays['ts']
+            type_id, deleted = arrays['type_id'], arrays['deleted']
+        
+        count = len(data['memories'])
+        if (stored != generation or len(data['meta_extra']) != count
+                or not len(ids) == len(ts) == len(type_id) == len(deleted) == len(matrix) == count):
+            raise ValueError(f"快照 {filepath}.json 與 {npz_path} 不一致")
+        
+        self._generation = generation or 0
+        self.memories = data['memories']
+        self.next_id = data['next_id']
+        self._type_names = data['type_names']
+        self._type_table = {name: i for i, name in enumerate(self._type_names)}
+        self._reset_columns()
+        self._id, self._ts = ids.astype(np.int64), ts.astype(np.float64)
+        self._type_id, self._deleted = type_id.astype(np.int16), deleted.astype(bool)
+        self._meta_extra = data['meta_extra']
+        self._id_to_pos = {int(memory_id): pos for pos, memory_id in enumerate(ids) if not deleted[pos]}
+        self.deleted_ids = set(ids[deleted].tolist())
+        self._set_vectors(matrix)
+        
+        print(f"已載入 {len(self.memories)} 條記憶")
+    
+    def _load_legacy_snapshot(self, filepath: str):
+        """載入舊版存檔（pickle + FAISS 索引），下次存檔時會轉成新格式"""
+        if os.path.exists(f"{filepath}.pkl"):
+            with open(f"{filepath}.pkl", 'rb') as f:
+                data = pickle.load(f)
+                memories = data.get('memories', [])
+                metadata = data.get('metadata', [])
+                memory_ids = data.get('memory_ids', [])
+                self.next_id = data.get('next_id', 0)
+                self.deleted_ids = data.get('deleted_ids', set())
+            
+            self.memories = []
+            self._reset_columns(len(memories))
+            for text, memory_id, meta in zip(memories, memory_ids, metadata):
+                self.memories.append(text)
+                self._append_columns(memory_id, meta)
+                if memory_id in self.deleted_ids:
+                    self._deleted[len(self.memories) - 1] = True
+                    del self._id_to_pos[memory_id]
+            
+            print(f"已載入 {len(self.memories)} 條記憶")
+        
+        # 載入 FAISS 索引（需要先有記憶 ID 才能對齊順序）
+        if os.path.exists(f"{filepath}.index"):
+            self._load_index_vectors(faiss.read_index(f"{filepath}.index"))
+    
     def load_from_disk(self, filepath: str):
         """從本地端載入記憶系統"""
         try:
-            # 載入 FAISS 索引
-            if os.path.exists(f"{filepath}.index"):
-                self.index = faiss.read_index(f"{filepath}.index")
+            self._pending_texts = []
+            self._invalidate_search_cache()
             
-            # 載入其他資料
-            if os.path.exists(f"{filepath}.pkl"):
-                with open(f"{filepath}.pkl", 'rb') as f:
-                    data = pickle.load(f)
-                    self.memories = data.get('memories', [])
-                    self.metadata = data.get('metadata', [])
-                    self.memory_ids = data.get('memory_ids', [])
-                    self.next_id = data.get('next_id', 0)
-                    self.deleted_ids = data.get('deleted_ids', set())
-                
-                print(f"已載入 {len(self.memories)} 條記憶")
+            if os.path.exists(f"{filepath}.json"):
+                try:
+                    self._load_snapshot(filepath)
+                except (OSError, KeyError, ValueError) as e:
+                    # 不一致的快照改名保留（下次存檔不會蓋掉），改用舊版存檔（若還在）與日誌重建
+                    print(f"快照無法使用，改用舊版存檔與日誌: {e}")
+                    os.replace(f"{filepath}.json", f"{filepath}.json.corrupt")
+                    self._load_legacy_snapshot(filepath)
+            else:
+                self._load_legacy_snapshot(filepath)
+            
+            self._snapshot_stale = not os.path.exists(f"{filepath}.json")
+            self._log_lines = 0
+            self._replay_log(filepath)
+            self._persisted_count = len(self.memories)
+            self._persisted_deleted = set(self.deleted_ids)
+            
+            self._load_emb_cache(f"{filepath}.embcache.npz")
             
         except Exception as e:
             print(f"載入失敗: {e}")
 
 
+def _alternation(words: List[str], flags: int = 0) -> re.Pattern:
+    """把一組關鍵詞編成單一正則（一次掃描就能判斷是否包含其中任一個）"""
+    return re.compile('|'.join(map(re.escape, words)), flags)
+
+
 class SmartMemoryTriggerDetector:
     """智能記憶觸發檢測器 - 使用語義分析而非關鍵字匹配"""
     
+    # 關鍵詞類別的位元旗標（個人資訊各類別從 PERSONAL_BASE 開始往上排）
+    QUERY, EXPLICIT, ACTION, FUTURE, IMPORTANCE, FIRST_PERSON, QUESTION_TAIL = (1 << i for i in range(7))
+    PERSONAL_BASE = 1 << 7
+    
     def __init__(self):
         # 個人資訊標識詞
         self.personal_indicators = {
@@ -342,6 +1049,71 @@ class SmartMemoryTriggerDetector:
             '記住', '記下', '記錄', '保存', '儲存', '記住這個',
             '別忘記', '要記得', 'remember', 'save this', 'keep in mind'
         ]
+        
+        self.question_starters = ('什麼', '怎麼', '為什麼', '在哪', '何時', '誰', '哪個', '哪裡')
+        self.question_endings = ('嗎？', '呢？', '吧？', '？', '嗎', '呢')
+        self.statement_question_endings = ('？', '?', '嗎', '呢', '吧')
+        self.action_verbs = ['是', '在', '有', '做', '喜歡', '討厭', '住', '工作', '學習']
+        self.future_indicators = [
+            '打算', '計劃', '想要', '希望', '準備', '將會', '要', '會',
+            '明天', '下週', '下個月', '以後', '等等', '提醒我'
+        ]
+        self.importance_indicators = [
+            '重要', '關鍵', '必須', '一定要', '務必', '千萬', '特別',
+            '注意', '記住', '別忘了'
+        ]
+        
+        # 每個關鍵詞類別 → (位元旗標, 詞表)；「我」涵蓋了我的、我在、我會、我有等第一人稱寫法
+        keyword_groups = [
+            (self.QUERY, self.query_indicators),
+            (self.EXPLICIT, self.explicit_memory_requests),
+            (self.ACTION, self.action_verbs),
+            (self.FUTURE, self.future_indicators),
+            (self.IMPORTANCE, self.importance_indicators),
+            (self.FIRST_PERSON, ['我'])
+        ]
+        # 個人資訊每類各佔一個位元，依類別順序檢查（前面的類別優先）
+        self._personal_order = []
+        for offset, category in enumerate(self.personal_indicators):
+            bit = self.PERSONAL_BASE << offset
+            keyword_groups.append((bit, self.personal_indicators[category]))
+            self._personal_order.append(
+                (bit, f'personal_{category}', 0.85 if category in ['身分', '偏好'] else 0.75)
+            )
+        
+        # Aho-Corasick 自動機：掃一次文字就得到所有命中類別的位元
+        self._automaton = None
+        self._category_res = []
+        if ahocorasick is not None:
+            word_bits = {}
+            for bit, words in keyword_groups:
+                for word in words:
+                    # 同一個詞可能屬於好幾類（如「記住」、「提醒我」）
+                    word_bits[word] = word_bits.get(word, 0) | bit
+            self._automaton = ahocorasick.Automaton()
+            for word, bits in word_bits.items():
+                self._automaton.add_word(word, bits)
+            self._automaton.make_automaton()
+        else:
+            self._category_res = [(bit, _alternation(words)) for bit, words in keyword_groups]
+    
+    def _match_categories(self, text: str) -> int:
+        """找出文字命中了哪些關鍵詞類別（位元旗標的聯集）"""
+        bits = 0
+        if self._automaton is not None:
+            for _, word_bits in self._automaton.iter(text):
+                bits |= word_bits
+        else:
+            for bit, pattern in self._category_res:
+                if pattern.search(text):
+                    bits |= bit
+        
+        # 開頭 / 結尾的疑問形式
+        if text.startswith(self.question_starters) or text.endswith(self.question_endings):
+            bits |= self.QUERY
+        if text.endswith(self.statement_question_endings):
+            bits |= self.QUESTION_TAIL
+        return bits
     
     def detect_memory_request(self, text: str) -> Tuple[bool, str, Optional[str], float]:
         """
@@ -351,115 +1123,42 @@ class SmartMemoryTriggerDetector:
             (should_remember, memory_type, extracted_content, confidence)
         """
         text = text.strip()
+        bits = self._match_categories(text)
         
-        # 1. 檢查是否為明確的查詢
-        if self._is_query(text):
+        # 1. 明確的查詢
+        if bits & self.QUERY:
             return False, "query", None, 0.9
         
-        # 2. 檢查明確記憶請求
-        explicit_match = self._check_explicit_memory_request(text)
-        if explicit_match:
-            return True, "explicit", explicit_match, 0.95
+        # 2. 明確記憶請求
+        if bits & self.EXPLICIT:
+            return True, "explicit", self._extract_explicit_content(text), 0.95
         
-        # 3. 檢查個人資訊模式
-        personal_match = self._check_personal_info(text)
-        if personal_match:
-            return True, personal_match['type'], text, personal_match['confidence']
+        # 3. 個人資訊
+        for bit, memory_type, confidence in self._personal_order:
+            if bits & bit:
+                return True, memory_type, text, confidence
         
-        # 4. 檢查語句結構和語義
-        structural_match = self._analyze_sentence_structure(text)
-        if structural_match:
-            return True, structural_match['type'], text, structural_match['confidence']
+        # 4. 語句結構：第一人稱 + 動作或狀態動詞、且不是疑問句的陳述句
+        if bits & self.FIRST_PERSON and bits & self.ACTION and not bits & self.QUESTION_TAIL:
+            return True, "declarative", text, 0.65
         
-        return False, "none", None, 0.0
-    
-    def _is_query(self, text: str) -> bool:
-        """判斷是否為查詢語句"""
-        # 檢查疑問詞開頭
-        question_starters = ['什麼', '怎麼', '為什麼', '在哪', '何時', '誰', '哪個', '哪裡']
-        if any(text.startswith(q) for q in question_starters):
-            return True
+        # 5. 未來計畫或提醒
+        if bits & self.FUTURE:
+            return True, "plan", text, 0.8
         
-        # 檢查疑問句模式
-        question_patterns = ['嗎？', '呢？', '吧？', '？', '嗎', '呢']
-        if any(text.endswith(q) for q in question_patterns):
-            return True
+        # 6. 重要事實或資訊
+        if bits & self.IMPORTANCE:
+            return True, "important_fact", text, 0.7
         
-        # 檢查查詢關鍵詞
-        return any(indicator in text for indicator in self.query_indicators)
+        return False, "none", None, 0.0
     
-    def _check_explicit_memory_request(self, text: str) -> Optional[str]:
-        """檢查明確的記憶請求"""
+    def _extract_explicit_content(self, text: str) -> str:
+        """提取明確記憶請求要記住的內容（依列表順序找出是哪個關鍵詞）"""
         for keyword in self.explicit_memory_requests:
             if keyword in text:
-                # 提取要記住的內容
-                parts = text.split(keyword, 1)
-                if len(parts) > 1:
-                    content = parts[1].strip(' ：:，,.。')
-                    return content if content else text
-                return text
-        return None
-    
-    def _check_personal_info(self, text: str) -> Optional[Dict]:
-        """檢查個人資訊"""
-        for category, indicators in self.personal_indicators.items():
-            for indicator in indicators:
-                if indicator in text:
-                    # 根據不同類型計算信心度
-                    confidence = 0.85 if category in ['身分', '偏好'] else 0.75
-                    return {
-                        'type': f'personal_{category}',
-                        'confidence': confidence
-                    }
-        return None
-    
-    def _analyze_sentence_structure(self, text: str) -> Optional[Dict]:
-        """分析語句結構判斷是否應該記憶"""
-        
-        # 1. 陳述句 - 通常包含個人資訊
-        if self._is_declarative_statement(text):
-            return {'type': 'declarative', 'confidence': 0.65}
-        
-        # 2. 未來計畫或提醒
-        if self._is_future_plan(text):
-            return {'type': 'plan', 'confidence': 0.8}
-        
-        # 3. 重要事實或資訊
-        if self._is_important_fact(text):
-            return {'type': 'important_fact', 'confidence': 0.7}
-        
-        return None
-    
-    def _is_declarative_statement(self, text: str) -> bool:
-        """判斷是否為陳述句"""
-        # 第一人稱陳述
-        first_person_patterns = ['我', '我的', '我在', '我會', '我有']
-        has_first_person = any(pattern in text for pattern in first_person_patterns)
-        
-        # 不是疑問句
-        is_not_question = not any(text.endswith(q) for q in ['？', '?', '嗎', '呢', '吧'])
-        
-        # 包含動作或狀態動詞
-        action_verbs = ['是', '在', '有', '做', '喜歡', '討厭', '住', '工作', '學習']
-        has_action = any(verb in text for verb in action_verbs)
-        
-        return has_first_person and is_not_question and has_action
-    
-    def _is_future_plan(self, text: str) -> bool:
-        """判斷是否為未來計畫"""
-        future_indicators = [
-            '打算', '計劃', '想要', '希望', '準備', '將會', '要', '會',
-            '明天', '下週', '下個月', '以後', '等等', '提醒我'
-        ]
-        return any(indicator in text for indicator in future_indicators)
-    
-    def _is_important_fact(self, text: str) -> bool:
-        """判斷是否為重要事實"""
-        importance_indicators = [
-            '重要', '關鍵', '必須', '一定要', '務必', '千萬', '特別',
-            '注意', '記住', '別忘了'
-        ]
-        return any(indicator in text for indicator in importance_indicators)
+                content = text.split(keyword, 1)[1].strip(' ：:，,.。')
+                return content if content else text
+        return text
 
 
 class MemoryDeletionDetector:
@@ -482,6 +1181,13 @@ class MemoryDeletionDetector:
             re.compile(pattern, re.IGNORECASE) 
             for pattern in self.deletion_keywords['explicit'] + self.deletion_keywords['specific_patterns']
         ]
+        # 所有樣式合成一條，每個樣式各佔一個群組（群組編號 = 列表順序 + 1）
+        self._deletion_re = re.compile(
+            '|'.join(f'({pattern.pattern})' for pattern in self.deletion_patterns),
+            re.IGNORECASE
+        )
+        self._scope_all = ('全部', '所有', 'all', 'everything')
+        self._scope_recent = ('最近', 'recent', '剛才', '今天')
     
     def detect_deletion_request(self, text: str) -> Dict:
         """檢測刪除請求"""
@@ -492,23 +1198,22 @@ class MemoryDeletionDetector:
             'deletion_scope': 'none'
         }
         
-        for pattern in self.deletion_patterns:
-            match = pattern.search(text)
-            if match:
-                result['is_deletion_request'] = True
-                result['deletion_type'] = 'explicit'
-                
-                target = self._extract_deletion_target(text, match)
-                result['target_content'] = target
-                
-                if any(word in text.lower() for word in ['全部', '所有', 'all', 'everything']):
-                    result['deletion_scope'] = 'all'
-                elif any(word in text.lower() for word in ['最近', 'recent', '剛才', '今天']):
-                    result['deletion_scope'] = 'recent'
-                else:
-                    result['deletion_scope'] = 'specific'
-                
-                break
+        # 掃一次找出所有命中，取列表中最前面的樣式（同一樣式取最早出現的位置）
+        match = min(self._deletion_re.finditer(text), key=lambda m: m.lastindex, default=None)
+        if match:
+            result['is_deletion_request'] = True
+            result['deletion_type'] = 'explicit'
+            
+            target = self._extract_deletion_target(text, match)
+            result['target_content'] = target
+            
+            lowered = text.lower()
+            if any(word in lowered for word in self._scope_all):
+                result['deletion_scope'] = 'all'
+            elif any(word in lowered for word in self._scope_recent):
+                result['deletion_scope'] = 'recent'
+            else:
+                result['deletion_scope'] = 'specific'
         
         return result
     
@@ -627,6 +1332,10 @@ class SmartChatbotWithMemory:
     def __init__(self, model_name='paraphrase-multilingual-MiniLM-L12-v2', memory_file='chatbot_memory'):
         self.memory_manager = SmartMemoryManager(model_name)
         self.memory_file = memory_file
+        # 實際使用的檢索方式：'sentence-transformers'（向量檢索）或 'simple'（文字比對）
+        self.backend_name = 'sentence-transformers' if self.memory_manager.memory_system.model else 'simple'
+        # 記憶寫入可能在背景執行緒進行，讀寫記憶庫時都要先拿這把鎖
+        self._lock = threading.RLock()
         
         # 嘗試載入既有記憶
         try:
@@ -647,6 +1356,27 @@ class SmartChatbotWithMemory:
         """
         user_input = user_input.strip()
         
+        result = self.classify_intent(user_input)
+        if result['has_response']:
+            return result, "", result.pop('memories', [])
+        
+        # 先做便宜的觸發判斷，明確的記憶指令就不必再跑嵌入模型搜尋
+        memory_decision = self.memory_manager.should_remember(user_input)
+        llm_context, relevant_memories = self.retrieve_context(user_input, memory_decision)
+        result['llm_context'] = llm_context
+        result.update(self.remember_if_needed(user_input, memory_decision))
+        
+        return result, llm_context, relevant_memories
+    
+    def classify_intent(self, user_input: str) -> Dict:
+        """
+        處理刪除、列出、統計等記憶管理指令（不需要LLM）
+        
+        Returns:
+            處理結果字典；has_response 為 True 代表已處理完，不需再問LLM
+        """
+        user_input = user_input.strip()
+        
         result = {
             'has_response': False,
             'response': '',
@@ -657,58 +1387,92 @@ class SmartChatbotWithMemory:
             'llm_context': ''  # 新增：給LLM的完整上下文
         }
         
-        # 1. 檢查刪除請求
-        deletion_result = self.memory_manager.process_deletion_request(user_input)
-        if deletion_result['success']:
-            result['has_response'] = True
-            result['response'] = deletion_result['message']
-            result['memory_action'] = 'delete'
-            result['deleted_count'] = deletion_result['deleted_count']
-            result['should_save'] = True
-            self._save_memory()
-            return result, "", []
+        with self._lock:
+            # 1. 檢查刪除請求
+            deletion_result = self.memory_manager.process_deletion_request(user_input)
+            if deletion_result['success']:
+                result['has_response'] = True
+                result['response'] = deletion_result['message']
+                result['memory_action'] = 'delete'
+                result['deleted_count'] = deletion_result['deleted_count']
+                result['should_save'] = True
+                self._save_memory()
+                return result
+            
+            # 2. 檢查特殊指令
+            if user_input.lower() in ['列出記憶', 'list memories', '顯示記憶', '記憶列表']:
+                memories = self._list_memories()
+                if not memories:
+                    result['response'] = "目前沒有任何記憶。"
+                else:
+                    memory_list = "\n".join([
+                        f"[ID:{m['id']}] {m['timestamp']} - {m['text']}" 
+                        for m in memories
+                    ])
+                    result['response'] = f"當前記憶:\n{memory_list}"
+                result['has_response'] = True
+                result['memories'] = memories
+                return result
+            
+            if user_input.lower() in ['記憶統計', 'memory stats', '統計']:
+                stats = self.memory_manager.memory_system.get_memory_stats()
+                result['response'] = (f"📊 記憶統計:\n"
+                                    f"活躍記憶: {stats['active']}\n"
+                                    f"已刪除: {stats['deleted']}\n"
+                                    f"總計: {stats['total']}\n"
+                                    f"需要清理: {'是' if stats['cleanup_needed'] else '否'}")
+                result['has_response'] = True
+                return result
         
-        # 2. 檢查特殊指令
-        if user_input.lower() in ['列出記憶', 'list memories', '顯示記憶', '記憶列表']:
-            memories = self._list_memories()
-            if not memories:
-                result['response'] = "目前沒有任何記憶。"
-            else:
-                memory_list = "\n".join([
-                    f"[ID:{m['id']}] {m['timestamp']} - {m['text']}" 
-                    for m in memories
-                ])
-                result['response'] = f"當前記憶:\n{memory_list}"
-            result['has_response'] = True
-            return result, "", memories
-        
-        if user_input.lower() in ['記憶統計', 'memory stats', '統計']:
-            stats = self.memory_manager.memory_system.get_memory_stats()
-            result['response'] = (f"📊 記憶統計:\n"
-                                f"活躍記憶: {stats['active']}\n"
-                                f"已刪除: {stats['deleted']}\n"
-                                f"總計: {stats['total']}\n"
-                                f"需要清理: {'是' if stats['cleanup_needed'] else '否'}")
-            result['has_response'] = True
-            return result, "", []
-        
-        # 3. 搜索相關記憶
-        relevant_memories = self.memory_manager.memory_system.search_memories(
-            user_input, top_k=3, threshold=0.6
-        )
+        return result
+    
+    def retrieve_context(self, user_input: str, memory_decision: Dict = None) -> Tuple[str, List[Dict]]:
+        """
+        搜索相關記憶並構建給LLM的完整上下文
+        
+        Args:
+            user_input: 用戶輸入文字
+            memory_decision: should_remember 的結果（有給的話，明確的記憶指令會跳過搜尋）
+        
+        Returns:
+            Tuple[給LLM的完整上下文, 相關記憶列表]
+        """
+        user_input = user_input.strip()
+        
+        if (memory_decision and memory_decision['memory_type'] == 'explicit'
+                and memory_decision['confidence'] > EXPLICIT_SKIP_SEARCH_CONFIDENCE):
+            relevant_memories = []
+        else:
+            with self._lock:
+                relevant_memories = self.memory_manager.memory_system.search_memories(
+                    user_input, top_k=3, threshold=0.6
+                )
         
-        # 4. 構建給LLM的完整上下文 - 這是關鍵改進！
         llm_context = self.memory_manager.build_context_with_memories(user_input, relevant_memories)
-        result['llm_context'] = llm_context
+        return llm_context, relevant_memories
+    
+    def remember_if_needed(self, user_input: str, memory_decision: Dict = None) -> Dict:
+        """
+        檢測是否需要記憶，需要的話存入並保存到磁盤（可在背景執行緒呼叫）
         
-        # 5. 檢測記憶請求
-        memory_decision = self.memory_manager.should_remember(user_input)
+        Args:
+            user_input: 用戶輸入文字
+            memory_decision: 已算好的 should_remember 結果（不給則在這裡判斷）
         
-        # 6. 根據檢測結果決定是否記憶
-        if memory_decision['should_remember']:
-            memory_content = memory_decision['extracted_content'] or user_input
-            
-            # 存儲記憶
+        Returns:
+            {'memory_action', 'memory_id', 'should_save'}
+        """
+        user_input = user_input.strip()
+        outcome = {'memory_action': 'none', 'memory_id': None, 'should_save': False}
+        
+        if memory_decision is None:
+            memory_decision = self.memory_manager.should_remember(user_input)
+        if not memory_decision['should_remember']:
+            return outcome
+        
+        memory_content = memory_decision['extracted_content'] or user_input
+        
+        with self._lock:
             memory_id = self.memory_manager.memory_system.add_memory(
                 memory_content,
                 metadata={
@@ -718,14 +1482,10 @@ class SmartChatbotWithMemory:
                     'original_input': user_input
                 }
             )
-            
-            result['memory_action'] = 'add'
-            result['memory_id'] = memory_id
-            result['should_save'] = True
-            
             self._save_memory()
         
-        return result, llm_context, relevant_memories
+        outcome.update(memory_action='add', memory_id=memory_id, should_save=True)
+        return outcome
     
     def get_relevant_memories(self, user_input: str, top_k: int = 3, threshold: float = 0.6) -> List[Dict]:
         """獲取與輸入最相關的記憶"""
@@ -733,8 +1493,9 @@ class SmartChatbotWithMemory:
     
     def add_memory_manually(self, content: str, metadata: Dict = None) -> int:
         """手動添加記憶"""
-        memory_id = self.memory_manager.memory_system.add_memory(content, metadata)
-        self._save_memory()
+        with self._lock:
+            memory_id = self.memory_manager.memory_system.add_memory(content, metadata)
+            self._save_memory()
         return memory_id
     
     def _list_memories(self, limit: int = 10) -> List[Dict]:
@@ -747,7 +1508,7 @@ class SmartChatbotWithMemory:
             self.memory_manager.memory_system.memories, 
             self.memory_manager.memory_system.metadata
         ):
-            if memory_id not in self.memory_manager.memory_system.deleted_ids and memory != "[DELETED]":
+            if memory_id not in self.memory_manager.memory_system.deleted_ids:
                 memories.append({
                     'id': memory_id,
                     'text': memory[:100] + "..." if len(memory) > 100 else memory,
@@ -763,7 +1524,8 @@ class SmartChatbotWithMemory:
     def _save_memory(self):
         """保存記憶到磁盤"""
         try:
-            self.memory_manager.memory_system.save_to_disk(self.memory_file)
+            with self._lock:
+                self.memory_manager.memory_system.save_to_disk(self.memory_file)
         except Exception as e:
             print(f"保存記憶失敗: {e}")
     
@@ -0,0 +1,152 @@
+"""
+LLM 回應快取模塊
+以語意相似度比對使用者輸入，重複的問題直接回傳先前的回答，不再呼叫LLM
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import numpy as np
+from typing import Optional, Tuple
+
+from memory_system import faiss
+
+
+class GenerativeCache:
+    """
+    語意回應快取 - (embedding, 回應) 存在 FAISS IndexFlatIP 中，滿了以 LRU 淘汰
+
+    每筆回應另外記下產生時的上下文範圍（scope）：同樣的問題但取到的記憶不同，不能沿用舊回答
+    """
+
+    def __init__(self, model, filepath: str = 'llm_response_cache.pkl',
+                 threshold: float = 0.93, maxlen: int = 512):
+        """
+        Args:
+            model: 記憶系統已載入的 SentenceTransformer（為 None 時快取停用）
+            filepath: 持久化檔案路徑
+            threshold: cosine 相似度門檻，超過才算命中
+            maxlen: 最多保留幾筆回應
+        """
+        self.model = model
+        self.filepath = filepath
+        self.threshold = threshold
+        self.maxlen = maxlen
+        self.dimension = model.get_sentence_embedding_dimension() if model else 0
+
+        self.embeddings = []   # 每筆皆已正規化
+        self.responses = []
+        self.scopes = []       # 每筆回應的 scope（見 scope_of）
+        self.last_used = []    # LRU 計數，數字越小越久沒用
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.index = faiss.IndexFlatIP(self.dimension)
+
+        self._load()
+
+    def _rebuild_index(self):
+        """依目前的 embeddings 重建索引（淘汰或載入後呼叫）"""
+        self.index = faiss.IndexFlatIP(self.dimension)
+        if self.embeddings:
+            self.index.add(np.stack(self.embeddings, dtype='float32'))
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    @staticmethod
+    def scope_of(prompt: str, context: Optional[str]) -> str:
+        """上下文去掉使用者輸入後的雜湊（系統提示 + 取到的記憶）；沒有上下文時為空字串"""
+        if not context:
+            return ""
+        return hashlib.blake2b(context.replace(prompt, "").encode("utf-8"), digest_size=16).hexdigest()
+
+    def lookup(self, prompt: str, scope: str = "") -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        查詢快取（只會命中 scope 相同的回應）
+
+        Returns:
+            Tuple[命中的回應（未命中為 None）, prompt 的 embedding（供之後 add 使用）]
+        """
+        if not self.model:
+            return None, None
+
+        # encode 已回傳 float32 numpy，不必再轉型複製
+        embedding = self.model.encode(
+            [prompt], convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False
+        )[0]
+
+        with self._lock:
+            if not self.responses:
+                return None, embedding
+            # 最多 maxlen 筆，整個排序一次也很便宜；依分數由高到低找第一筆 scope 相同的
+            scores, indices = self.index.search(embedding[None, :], len(self.responses))
+            for score, idx in zip(scores[0], indices[0]):
+                if score <= self.threshold:
+                    break
+                if 0 <= idx < len(self.responses) and self.scopes[idx] == scope:
+                    self.last_used[idx] = self._tick()
+                    return self.responses[idx], embedding
+
+        return None, embedding
+
+    def add(self, embedding: Optional[np.ndarray], response: str, scope: str = ""):
+        """存入新的回應，超過上限時淘汰最久沒用的一筆"""
+        if embedding is None or not response:
+            return
+
+        with self._lock:
+            self.embeddings.append(embedding)
+            self.responses.append(response)
+            self.scopes.append(scope)
+            self.last_used.append(self._tick())
+
+            if len(self.responses) > self.maxlen:
+                oldest = int(np.argmin(self.last_used))
+                del self.embeddings[oldest], self.responses[oldest], self.scopes[oldest], self.last_used[oldest]
+                self._rebuild_index()
+            else:
+                self.index.add(embedding[None, :])
+
+    def clear(self):
+        """清空快取（記憶有變動時呼叫，避免回傳過時的回答）"""
+        with self._lock:
+            self.embeddings, self.responses, self.scopes, self.last_used = [], [], [], []
+            self._rebuild_index()
+
+    def save_to_disk(self):
+        """保存快取到本地端"""
+        if not self.model:
+            return
+        try:
+            with self._lock:
+                with open(self.filepath, 'wb') as f:
+                    pickle.dump({
+                        'dimension': self.dimension,
+                        'embeddings': self.embeddings,
+                        'responses': self.responses,
+                        'scopes': self.scopes,
+                        'last_used': self.last_used
+                    }, f)
+        except Exception as e:
+            print(f"保存回應快取失敗: {e}")
+
+    def _load(self):
+        """從本地端載入快取（維度不符、或是沒有 scope 的舊版快取時視為沒有快取）"""
+        if not self.model or not os.path.exists(self.filepath):
+            return
+        try:
+            with open(self.filepath, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('dimension') != self.dimension or 'scopes' not in data:
+                return
+            self.embeddings = data.get('embeddings', [])
+            self.responses = data.get('responses', [])
+            self.scopes = data['scopes']
+            self.last_used = data.get('last_used', [0] * len(self.responses))
+            self._clock = max(self.last_used, default=0)
+            self._rebuild_index()
+            print(f"已載入 {len(self.responses)} 筆回應快取")
+        except Exception as e:
+            print(f"載入回應快取失敗: {e}")
@@ -4,10 +4,90 @@
 """
 
 from PyQt5.QtWidgets import QWidget, QLabel, QVBoxLayout, QHBoxLayout, QPushButton, QApplication
-from PyQt5.QtCore import Qt, QTimer, QTime, pyqtSignal
+from PyQt5.QtCore import Qt, QTimer, QTime, QElapsedTimer, pyqtSignal
 from PyQt5.QtGui import QFont, QPalette
 
 
+# 主容器的樣式表：各標籤的樣式依 objectName + 動態屬性 state 選擇，切換狀態時只需重新 polish 該標籤
+_QSS_CONTAINER = """
+    QWidget {
+        background-color: rgba(255, 255, 255, 200);
+        border-radius: 15px;
+        border: 2px solid rgba(100, 149, 237, 150);
+    }
+    QLabel#time {
+        border-radius: 10px;
+        font-weight: bold;
+        letter-spacing: 2px;
+    }
+    QLabel#time[state="normal"] {
+        color: #e74c3c;
+        background-color: rgba(0, 0, 0, 50);
+        border: 2px solid rgba(231, 76, 60, 180);
+    }
+    QLabel#time[state="warn"] {
+        color: #ff6b6b;
+        background-color: rgba(255, 107, 107, 40);
+        border: 2px solid #ff6b6b;
+    }
+    QLabel#title {
+        background-color: transparent;
+        border: none;
+    }
+    QLabel#title[state="reading"] {
+        font-weight: bold;
+    }
+    QLabel#title[state="resumed"] {
+        color: #2c3e50;
+    }
+    QLabel#title[state="paused"] {
+        color: #f39c12;
+        font-weight: bold;
+    }
+    QLabel#title[state="countdown"] {
+        color: #ff6b6b;
+        font-weight: bold;
+    }
+    QLabel#title[state="done"] {
+        color: #27ae60;
+        font-weight: bold;
+    }
+    QLabel#progress {
+        color: #7f8c8d;
+        background-color: transparent;
+        border: none;
+    }
+"""
+
+# 暫停 / 停止按鈕的樣式
+_QSS_BTN_PAUSE = """
+    QPushButton {
+        background-color: #f39c12;
+        color: white;
+        border: none;
+        border-radius: 6px;
+        font-size: 12px;
+        font-weight: bold;
+    }
+    QPushButton:hover {
+        background-color: #e67e22;
+    }
+"""
+_QSS_BTN_STOP = """
+    QPushButton {
+        background-color: #e74c3c;
+        color: white;
+        border: none;
+        border-radius: 6px;
+        font-size: 12px;
+        font-weight: bold;
+    }
+    QPushButton:hover {
+        background-color: #c0392b;
+    }
+"""
+
+
 class StudyTimerWidget(QWidget):
     """學習倒數計時器視窗"""
     
@@ -16,11 +96,25 @@ class StudyTimerWidget(QWidget):
     timer_paused = pyqtSignal()
     timer_resumed = pyqtSignal()
     
+    # 各顏色階段（0 一般、1 最後一分鐘、2 最後10秒）對應的時間標籤狀態
+    _TIME_STATES = ("normal", "warn", "warn")
+    # 預先格式化好的時間字串最多涵蓋這麼多秒，更長的時段超出的部分才即時格式化
+    FMT_CACHE_SECONDS = 7200
+    # 檢查剩餘時間的間隔（毫秒）；剩餘秒數由經過時間推算，間隔短於一秒才不會跳秒
+    TICK_MS = 500
+    
     def __init__(self, total_seconds: int, parent=None):
         super().__init__(parent)
         self.total_seconds = total_seconds
         self.remaining_seconds = total_seconds
         self.is_paused = False
+        # 目前的顏色階段（只有階段改變時才重設樣式表）
+        self._phase = 0
+        # 每秒顯示的時間字串先算好，計時中只需查表
+        self._fmt = [self._format_time(i) for i in range(min(total_seconds, self.FMT_CACHE_SECONDS) + 1)]
+        # 上一次設定的文字：字串沒變就不呼叫 setText（避免多餘的重新排版與重繪）
+        self._last_time_str = None
+        self._last_progress_str = None
         
         # 拖動相關變數
         self.dragging = False
@@ -34,6 +128,8 @@ class StudyTimerWidget(QWidget):
         """建立時間顯示標籤"""
         time_label = QLabel(text)
         time_label.setAlignment(Qt.AlignCenter)
+        # 純文字：每秒 setText 時不必先猜是不是 rich text
+        time_label.setTextFormat(Qt.PlainText)
 
         # 使用系統字體確保相容性
         time_font = QFont()
@@ -45,15 +141,9 @@ class StudyTimerWidget(QWidget):
         # 設定合適大小，避免壓縮
         time_label.setFixedSize(280, 70)
 
-        # 優化的樣式
-        time_label.setStyleSheet("""
-            color: #e74c3c;
-            background-color: rgba(0, 0, 0, 50);
-            border-radius: 10px;
-            border: 2px solid rgba(231, 76, 60, 180);
-            font-weight: bold;
-            letter-spacing: 2px;
-        """)
+        # 樣式由主容器的樣式表依 state 屬性決定
+        time_label.setObjectName("time")
+        time_label.setProperty("state", "normal")
 
         return time_label
     
@@ -73,14 +163,8 @@ class StudyTimerWidget(QWidget):
         layout = QVBoxLayout()
         layout.setContentsMargins(0, 0, 0, 0)
         
-        # 設置主容器背景 - 半透明白底
-        main_container.setStyleSheet("""
-            QWidget {
-                background-color: rgba(255, 255, 255, 200);
-                border-radius: 15px;
-                border: 2px solid rgba(100, 149, 237, 150);
-            }
-        """)
+        # 設置主容器背景 - 半透明白底（連同各標籤所有狀態的樣式，只設定這一次）
+        main_container.setStyleSheet(_QSS_CONTAINER)
         
         # 內容佈局
         content_layout = QVBoxLayout(main_container)
@@ -90,20 +174,18 @@ class StudyTimerWidget(QWidget):
         # 標題
         self.title_label = QLabel("📚 讀書陪伴中")
         self.title_label.setAlignment(Qt.AlignCenter)
+        self.title_label.setTextFormat(Qt.PlainText)
         title_font = QFont()
         title_font.setPointSize(14)
         title_font.setBold(True)
         self.title_label.setFont(title_font)
         self.title_label.setFixedHeight(30)
-        self.title_label.setStyleSheet("""
-                background-color: transparent;
-                border: none;
-                font-weight: bold;
-        """)
+        self.title_label.setObjectName("title")
+        self.title_label.setProperty("state", "reading")
         content_layout.addWidget(self.title_label)
         
         # 時間顯示
-        self.time_label = self.create_timer_label(self._format_time(self.remaining_seconds))
+        self.time_label = self.create_timer_label(self._time_text(self.remaining_seconds))
         content_layout.addWidget(self.time_label, alignment=Qt.AlignCenter)
         
         # 控制按鈕
@@ -113,36 +195,12 @@ class StudyTimerWidget(QWidget):
         self.pause_button = QPushButton("⏸️ 暫停")
         self.pause_button.clicked.connect(self._toggle_pause)
         self.pause_button.setFixedSize(90, 32)
-        self.pause_button.setStyleSheet("""
-            QPushButton {
-                background-color: #f39c12;
-                color: white;
-                border: none;
-                border-radius: 6px;
-                font-size: 12px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #e67e22;
-            }
-        """)
+        self.pause_button.setStyleSheet(_QSS_BTN_PAUSE)
         
         self.stop_button = QPushButton("⏹️ 停止")
         self.stop_button.clicked.connect(self._stop_timer)
         self.stop_button.setFixedSize(90, 32)
-        self.stop_button.setStyleSheet("""
-            QPushButton {
-                background-color: #e74c3c;
-                color: white;
-                border: none;
-                border-radius: 6px;
-                font-size: 12px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #c0392b;
-            }
-        """)
+        self.stop_button.setStyleSheet(_QSS_BTN_STOP)
         
         button_layout.addStretch()
         button_layout.addWidget(self.pause_button)
@@ -153,15 +211,12 @@ class StudyTimerWidget(QWidget):
         # 進度條
         self.progress_label = QLabel("")
         self.progress_label.setAlignment(Qt.AlignCenter)
+        self.progress_label.setTextFormat(Qt.PlainText)
         self.progress_label.setFixedHeight(20)
         progress_font = QFont()
         progress_font.setPointSize(9)
         self.progress_label.setFont(progress_font)
-        self.progress_label.setStyleSheet("""
-            color: #7f8c8d; 
-            background-color: transparent;
-            border: none;
-        """)
+        self.progress_label.setObjectName("progress")
         content_layout.addWidget(self.progress_label)
         
         # 將主容器加入佈局
@@ -173,9 +228,17 @@ class StudyTimerWidget(QWidget):
     
     def setup_timer(self):
         """設置計時器"""
+        # 剩餘時間以實際經過的時間計算（扣掉暫停的部分），不靠每次 tick 減一，長時間也不會漂移
+        self._elapsed = QElapsedTimer()
+        self._elapsed.start()
+        self._paused_ms = 0
+        self._pause_started_ms = 0
+        
         self.countdown_timer = QTimer()
+        # 不需要毫秒級精準，讓系統可以合併喚醒
+        self.countdown_timer.setTimerType(Qt.CoarseTimer)
         self.countdown_timer.timeout.connect(self._update_countdown)
-        self.countdown_timer.start(1000)  # 每秒更新一次
+        self.countdown_timer.start(self.TICK_MS)
     
     def center_on_screen(self):
         """將視窗置於螢幕中央"""
@@ -195,73 +258,88 @@ class StudyTimerWidget(QWidget):
         else:
             return f"{minutes:02d}:{secs:02d}"
     
+    def _time_text(self, seconds: int) -> str:
+        """取得時間顯示字串（優先查預先算好的表）"""
+        if 0 <= seconds < len(self._fmt):
+            return self._fmt[seconds]
+        return self._format_time(seconds)
+    
     def _update_countdown(self):
         """更新倒數計時"""
         if self.is_paused:
             return
         
-        self.remaining_seconds -= 1
-        self.time_label.setText(self._format_time(self.remaining_seconds))
+        elapsed_seconds = (self._elapsed.elapsed() - self._paused_ms) // 1000
+        remaining = max(self.total_seconds - elapsed_seconds, 0)
+        if remaining == self.remaining_seconds:
+            return  # 還在同一秒，畫面不必更新
+        self.remaining_seconds = remaining
+        time_str = self._time_text(self.remaining_seconds)
+        if time_str != self._last_time_str:
+            self._last_time_str = time_str
+            self.time_label.setText(time_str)
         self._update_progress()
         
-        # 時間快結束時改變顏色
-        if self.remaining_seconds <= 60:  # 最後一分鐘
-            self.time_label.setStyleSheet("""
-                color: #ff6b6b;
-                background-color: rgba(255, 107, 107, 40);
-                border-radius: 10px;
-                border: 2px solid #ff6b6b;
-                font-weight: bold;
-                letter-spacing: 2px;
-            """)
-            
-            # 最後10秒閃爍效果
-            if self.remaining_seconds <= 10:
-                self.title_label.setText(f"⏰ 還剩 {self.remaining_seconds} 秒！")
-                self.title_label.setStyleSheet("""
-                    color: #ff6b6b; 
-                    background-color: transparent;
-                    border: none;
-                    font-weight: bold;
-                """)
+        # 時間快結束時改變顏色：最後一分鐘 → 1，最後10秒 → 2；同一階段內不重設樣式表
+        phase = 2 if self.remaining_seconds <= 10 else 1 if self.remaining_seconds <= 60 else 0
+        if phase != self._phase:
+            self._phase = phase
+            self._set_state(self.time_label, self._TIME_STATES[phase])
+            if phase == 2:
+                self._set_state(self.title_label, "countdown")
+        
+        # 最後10秒閃爍效果
+        if phase == 2:
+            self.title_label.setText(f"⏰ 還剩 {self.remaining_seconds} 秒！")
         
         # 檢查是否結束
         if self.remaining_seconds <= 0:
             self._timer_finished()
     
+    def _set_state(self, label: QLabel, state: str):
+        """切換標籤的樣式狀態（樣式表不變，只重新 polish 這個標籤）"""
+        if label.property("state") == state:
+            return
+        label.setProperty("state", state)
+        label.style().unpolish(label)
+        label.style().polish(label)
+    
     def _update_progress(self):
         """更新進度顯示"""
         if self.total_seconds > 0:
             progress_percent = ((self.total_seconds - self.remaining_seconds) / self.total_seconds) * 100
             elapsed_minutes = (self.total_seconds - self.remaining_seconds) // 60
             total_minutes = self.total_seconds // 60
-            self.progress_label.setText(f"進度: {progress_percent:.1f}% ({elapsed_minutes}/{total_minutes} 分鐘)")
+            progress_str = f"進度: {progress_percent:.1f}% ({elapsed_minutes}/{total_minutes} 分鐘)"
         else:
-            self.progress_label.setText("進度: 100%")
+            progress_str = "進度: 100%"
+        
+        # 百分比只到小數一位，長時段大多數秒數的字串都跟上一秒一樣
+        if progress_str != self._last_progress_str:
+            self._last_progress_str = progress_str
+            self.progress_label.setText(progress_str)
     
     def _toggle_pause(self):
         """切換暫停/繼續"""
         self.is_paused = not self.is_paused
         
         if self.is_paused:
+            # 暫停期間不必喚醒計時器
+            self._pause_started_ms = self._elapsed.elapsed()
+            self.countdown_timer.stop()
             self.pause_button.setText("▶️ 繼續")
             self.title_label.setText("⏸️ 已暫停")
-            self.title_label.setStyleSheet("""
-                color: #f39c12; 
-                background-color: transparent;
-                border: none;
-                font-weight: bold;
-            """)
+            self._set_state(self.title_label, "paused")
             self.timer_paused.emit()
             print("⏸️ 學習計時器已暫停")
         else:
+            self._paused_ms += self._elapsed.elapsed() - self._pause_started_ms
+            self.countdown_timer.start(self.TICK_MS)
             self.pause_button.setText("⏸️ 暫停")
             self.title_label.setText("📚 讀書陪伴中")
-            self.title_label.setStyleSheet("""
-                color: #2c3e50; 
-                background-color: transparent;
-                border: none;
-            """)
+            self._set_state(self.title_label, "resumed")
+            # 標題狀態被換掉了：下一次更新時重新套用目前階段的狀態
+            self._phase = -1
             self.timer_resumed.emit()
             print("▶️ 學習計時器已繼續")
     
@@ -280,12 +358,7 @@ class StudyTimerWidget(QWidget):
         # 更新顯示
         self.time_label.setText("00:00")
         self.title_label.setText("🎉 時間到！")
-        self.title_label.setStyleSheet("""
-            color: #27ae60; 
-            background-color: transparent;
-            border: none;
-            font-weight: bold;
-        """)
+        self._set_state(self.title_label, "done")
         self.progress_label.setText("進度: 100% - 完成！")
         
         # 隱藏控制按鈕